@@ -0,0 +1,62 @@
+from simulator import AsyncMachineControl, StateMachine
+import asyncio
+import time
+
+
+class Crawler(StateMachine):
+    def __init__(self, ctl, ctx, n):
+        super().__init__(ctl, ctx)
+
+        self.n = n
+
+        self.i = 0
+        self.togo = n
+        self.started = None
+
+        self.init_state = self.setup
+
+    def __repr__(self):
+        return '<Crawler:togo=%d>' % (self.togo)
+
+    def setup(self):
+        self.started = time.perf_counter()
+        self.when('fetched', self.fetched)
+
+        return self.start_fetchers
+
+    def start_fetchers(self):
+        if self.i < self.n:
+            self.i += 1
+            self.start_machine(Fetcher, 'page %d' % (self.i))
+            return self.start_fetchers
+
+    def fetched(self):
+        self.togo -= 1
+
+        if self.togo == 0:
+            print('Fetched %d pages in %.2f seconds' % (
+                self.n, time.perf_counter() - self.started))
+            return self.halt
+
+
+class Fetcher(StateMachine):
+    def __init__(self, ctl, ctx, url):
+        super().__init__(ctl, ctx)
+
+        self.url = url
+
+        self.init_state = self.fetch
+
+    def __repr__(self):
+        return '<Fetcher:url=%s>' % (self.url)
+
+    async def fetch(self):
+        # Stands in for actual I/O, like an HTTP request.
+        await asyncio.sleep(0.5)
+
+        self.emit_to(self.ctx, 'fetched', value=self.url)
+
+
+if __name__ == '__main__':
+    ctl = AsyncMachineControl(debug=False)
+    ctl.run(Crawler, 1000)
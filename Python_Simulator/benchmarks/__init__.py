@@ -0,0 +1,5 @@
+"""Benchmarks for the simulator's machine control.
+
+Each module in this package can be run directly from the `Python_Simulator`
+directory, e.g. `python -m benchmarks.broadcast`.
+"""
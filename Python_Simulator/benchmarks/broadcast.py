@@ -0,0 +1,110 @@
+"""Measure broadcast throughput as the number of idle machines grows.
+
+A producer broadcasts `ping' events which only a single consumer reacts to.
+All other machines are idle bystanders, listening for an event that never
+comes. Ideally, the cost of a broadcast does not depend on the number of
+bystanders.
+"""
+import argparse
+import time
+
+from simulator import MachineControl, StateMachine
+
+
+class Producer(StateMachine):
+    def __init__(self, ctl, ctx, bystanders, pings, result):
+        super().__init__(ctl, ctx)
+
+        self.bystanders = bystanders
+        self.pings = pings
+        self.result = result
+
+        self.i = 0
+        self.consumer = None
+        self.started = None
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.consumer = self.start_machine(Consumer)
+        self.when_machine_emits('pong', self.consumer, self.ping)
+
+        return self.spawn
+
+    def spawn(self):
+        if self.i < self.bystanders:
+            self.start_machine(Bystander)
+            self.i += 1
+            return self.spawn
+
+        self.i = 0
+        self.started = time.perf_counter()
+
+        return self.ping
+
+    def ping(self):
+        if self.i < self.pings:
+            self.i += 1
+            self.emit('ping')
+            return
+
+        self.result.append(time.perf_counter() - self.started)
+
+        return self.halt
+
+
+class Consumer(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when('ping', self.pong)
+
+    def pong(self):
+        self.emit('pong')
+
+
+class Bystander(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when('never', self.halt)
+
+
+def measure(bystanders, pings, **kwargs):
+    """Return the number of events per second for a single run.
+
+    Arguments:
+        bystanders: the number of idle machines
+        pings: the number of `ping' broadcasts to send
+        \*\*kwargs: any arguments for MachineControl
+    """
+    result = []
+
+    ctl = MachineControl(debug=False, **kwargs)
+    ctl.run(Producer, bystanders, pings, result)
+
+    return 2 * pings / result[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pings', type=int, default=2000)
+    parser.add_argument('--ready-queue', action='store_true')
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    print('%10s %14s' % ('machines', 'events/sec'))
+    for size in args.sizes:
+        print('%10d %14.0f' % (size, measure(size, args.pings,
+                                           ready_queue=args.ready_queue)))
+
+
+if __name__ == '__main__':
+    main()
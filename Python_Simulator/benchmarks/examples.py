@@ -0,0 +1,294 @@
+"""Measure machine control on the example programs bundled with the simulator.
+
+Each example runs headless, with its output silenced. Input sizes grow with
+`--scale`. For every example, the wall time, cycles per second, events per
+second and peak memory are reported as JSON.
+
+The report can be saved as a baseline with `--save`. Later runs are compared
+against it, and slowdowns or memory growth beyond `--tolerance` are listed,
+after which the exit status is 1. Timings only compare well on the same
+machine, with the same scale and options.
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from simulator import MachineControl
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'examples_baseline.json')
+
+
+@functools.lru_cache()
+def load(name):
+    """Load an example program by file name.
+
+    Examples are loaded by path, as e.g. `test` would otherwise refer to the
+    standard library's package.
+
+    Arguments:
+        name: the example's file name, without extension
+    """
+    spec = importlib.util.spec_from_file_location(
+        'example_%s' % (name), os.path.join(ROOT, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def random_list(size):
+    """Return a list of random integers, the same for every run.
+
+    Arguments:
+        size: the length of the list
+    """
+    rng = random.Random(1)
+    return [rng.randint(0, 1000) for _ in range(size)]
+
+
+def fill_table(size):
+    """Return a Turing machine table that is guaranteed to halt.
+
+    The machine writes a row of ones, walks back over it and halts.
+
+    Arguments:
+        size: the number of ones to write
+    """
+    table = {}
+
+    for i in range(size - 1):
+        table['F%d' % (i)] = {'0': ('R', '1', 'F%d' % (i + 1))}
+
+    table['F%d' % (size - 1)] = {'0': ('L', '1', 'B')}
+    table['B'] = {'1': ('L', '1', 'B'),
+                  '0': ('N', '0', 'halt')}
+
+    return table
+
+
+# Each workload returns a machine class, with its positional and keyword
+# arguments, for a given scale.
+def sieve(scale):
+    return load('sieve').Sieve, (30 * scale,), {}
+
+
+def sieve_multicast(scale):
+    return load('sieve_multicast').Sieve, (30 * scale,), {}
+
+
+def bubblesort(scale):
+    return load('bubblesort').BubbleSort, (random_list(40 * scale),), {}
+
+
+def bubblesort_opt(scale):
+    return load('bubblesort_opt').BubbleSort, (random_list(40 * scale),), {}
+
+
+def bubblesort_opt2(scale):
+    return load('bubblesort_opt2').BubbleSort, (random_list(40 * scale),), {}
+
+
+def turing(scale):
+    return load('turing').TuringMachine, (fill_table(1000 * scale), 'F0'), {
+        'default': '0', 'show_steps': False}
+
+
+def test(scale):
+    return load('test').TestA, (200 * scale,), {}
+
+
+def harddrive(scale):
+    # The program has a fixed size. Only its random seek times vary.
+    random.seed(1)
+    return load('harddrive').CPU, (), {}
+
+
+WORKLOADS = {
+    'sieve': sieve,
+    'sieve_multicast': sieve_multicast,
+    'bubblesort': bubblesort,
+    'bubblesort_opt': bubblesort_opt,
+    'bubblesort_opt2': bubblesort_opt2,
+    'turing': turing,
+    'test': test,
+    'harddrive': harddrive,
+}
+
+
+class CountingControl(MachineControl):
+    """Machine control that counts its cycles and events."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.cycles = 0
+        self.events = 0
+
+    def cycle(self):
+        self.cycles += 1
+        return super().cycle()
+
+    def reset(self):
+        self.events = self.event_n
+        super().reset()
+
+
+def run_once(workload, **kwargs):
+    """Run an example once and return its control and wall time.
+
+    Arguments:
+        workload: a machine class, with its positional and keyword arguments
+        \*\*kwargs: any arguments for MachineControl
+    """
+    machine_cls, args, machine_kwargs = workload
+
+    ctl = CountingControl(debug=False, **kwargs)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        ctl.run(machine_cls, *args, **machine_kwargs)
+        wall_time = time.perf_counter() - started
+
+    return ctl, wall_time
+
+
+def measure(name, scale, repeat, **kwargs):
+    """Return the measurements of an example, as a dictionary.
+
+    The fastest of several runs is used for timing. Peak memory is measured
+    in a separate run, as tracing allocations slows the simulator down.
+
+    Arguments:
+        name: the example's name, a key of WORKLOADS
+        scale: the input size multiplier
+        repeat: the number of timed runs
+        \*\*kwargs: any arguments for MachineControl
+    """
+    wall_time = None
+
+    for _ in range(repeat):
+        ctl, t = run_once(WORKLOADS[name](scale), **kwargs)
+
+        if wall_time is None or t < wall_time:
+            wall_time = t
+
+    workload = WORKLOADS[name](scale)
+
+    tracemalloc.start()
+    run_once(workload, **kwargs)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'wall_time': wall_time,
+        'cycles': ctl.cycles,
+        'events': ctl.events,
+        'cycles_per_sec': ctl.cycles / wall_time,
+        'events_per_sec': ctl.events / wall_time,
+        'peak_memory': peak_memory,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of regressions of a report against a baseline.
+
+    Arguments:
+        report: the current report
+        baseline: a previously saved report
+        tolerance: the allowed relative slowdown or memory growth
+    """
+    regressions = []
+
+    for name, current in sorted(report['workloads'].items()):
+        previous = baseline['workloads'].get(name)
+        if previous is None:
+            continue
+
+        for key in ('cycles_per_sec', 'events_per_sec'):
+            if current[key] < previous[key] * (1 - tolerance):
+                regressions.append('%s: %s dropped from %.0f to %.0f' % (
+                    name, key, previous[key], current[key]))
+
+        if current['peak_memory'] > previous['peak_memory'] * (1 + tolerance):
+            regressions.append('%s: peak_memory grew from %d to %d' % (
+                name, previous['peak_memory'], current['peak_memory']))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--ready-queue', action='store_true')
+    parser.add_argument('--quantum', type=int, default=1)
+    parser.add_argument('--skip-ignored', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--save', action='store_true',
+                        help='save the report as the new baseline')
+    parser.add_argument('workloads', nargs='*', default=list(WORKLOADS))
+    args = parser.parse_args()
+
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error('unknown workload %r, choose from %s' % (
+                name, ', '.join(WORKLOADS)))
+
+    report = {
+        'scale': args.scale,
+        'ready_queue': args.ready_queue,
+        'quantum': args.quantum,
+        'skip_ignored': args.skip_ignored,
+        'workloads': {},
+    }
+
+    for name in args.workloads:
+        report['workloads'][name] = measure(name, args.scale, args.repeat,
+                                            ready_queue=args.ready_queue,
+                                            quantum=args.quantum,
+                                            skip_ignored=args.skip_ignored)
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if (baseline['scale'] != report['scale']
+            or baseline['ready_queue'] != report['ready_queue']
+            or baseline.get('quantum', 1) != report['quantum']
+            or baseline.get('skip_ignored', False) != report['skip_ignored']):
+        sys.stderr.write('Baseline was measured with other options, '
+                         'not comparing.\n')
+        return
+
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        sys.stderr.write(regression + '\n')
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Measure how CPU-heavy machines scale over parallel worker processes.
+
+A farm starts a number of crunchers and sends each of them a job. Every job
+keeps its cruncher busy in a single, CPU-heavy state. The wall time is
+reported for an increasing number of workers.
+"""
+import argparse
+import time
+
+from simulator import MachineControl, ParallelMachineControl, StateMachine
+
+
+class Farm(StateMachine):
+    def __init__(self, ctl, ctx, crunchers, work):
+        super().__init__(ctl, ctx)
+
+        self.crunchers = crunchers
+        self.work = work
+
+        self.i = 0
+        self.togo = crunchers
+
+        self.init_state = self.spawn
+
+    def spawn(self):
+        if self.i < self.crunchers:
+            cruncher = self.start_machine(Cruncher)
+            self.when_machine_emits('done', cruncher, self.done)
+            self.emit_to(cruncher, 'job', value=self.work)
+
+            self.i += 1
+            return self.spawn
+
+    def done(self):
+        self.togo -= 1
+
+        if self.togo == 0:
+            return self.halt
+
+
+class Cruncher(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when_machine_emits('job', self.ctx, self.crunch)
+
+    def crunch(self):
+        total = 0
+        for i in range(self.event.value):
+            total += i * i
+
+        self.emit_to(self.ctx, 'done', value=total)
+
+
+def measure(workers, crunchers, work):
+    """Return the wall time of a single run.
+
+    Arguments:
+        workers: the number of worker processes, or 0 for MachineControl
+        crunchers: the number of crunchers
+        work: the number of loop iterations per job
+    """
+    if workers == 0:
+        ctl = MachineControl(debug=False, ready_queue=True)
+    else:
+        ctl = ParallelMachineControl(workers=workers)
+
+    started = time.perf_counter()
+    ctl.run(Farm, crunchers, work)
+
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--crunchers', type=int, default=64)
+    parser.add_argument('--work', type=int, default=200000)
+    parser.add_argument('workers', type=int, nargs='*', default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    print('%8s %10s' % ('workers', 'seconds'))
+    for workers in args.workers:
+        print('%8d %10.3f' % (
+            workers, measure(workers, args.crunchers, args.work)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Check that reaction tables do not grow during a long run.
+
+A spawner repeatedly starts a worker, sends it a job with acknowledgement,
+waits for its result and halts it. Every generation adds reactions to and of
+the worker, all of which should be removed once the worker has halted. The
+size of the reaction tables and the traced memory are reported at a number of
+checkpoints, and the run fails if either grew after the first generation.
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from simulator import MachineControl, StateMachine
+
+
+class Spawner(StateMachine):
+    def __init__(self, ctl, ctx, generations, checkpoints, samples):
+        super().__init__(ctl, ctx)
+
+        self.generations = generations
+        self.checkpoints = checkpoints
+        self.samples = samples
+
+        self.i = 0
+        self.worker = None
+
+        self.init_state = self.spawn
+
+    def spawn(self):
+        if self.i % (self.generations // self.checkpoints) == 0:
+            gc.collect()
+            self.samples.append((self.i, reaction_count(self.ctl),
+                                 tracemalloc.get_traced_memory()[0]))
+
+        if self.i == self.generations:
+            return self.halt
+
+        self.i += 1
+
+        self.worker = self.start_machine(Worker)
+        self.when_machine_emits('result', self.worker, self.result)
+        self.emit_to(self.worker, 'job', value=self.i, ack_state=self.listen)
+
+    def result(self):
+        self.emit_to(self.worker, 'halt')
+
+        return self.spawn
+
+
+class Worker(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when_machine_emits('job', self.ctx, self.job)
+
+    def job(self):
+        self.emit_to(self.ctx, 'result', value=self.event.value * 2)
+
+
+def reaction_count(ctl):
+    """Return the number of reactions and reverse index entries in use.
+
+    Arguments:
+        ctl: a MachineControl instance
+    """
+    count = 0
+
+    for reactions in (ctl.event_reactions, ctl.machine_reactions):
+        count += sum(len(r) for r in reactions.values())
+
+    for keys in (ctl.event_keys, ctl.machine_keys, ctl.emitter_keys):
+        count += len(keys) + sum(len(k) for k in keys.values())
+
+    return count
+
+
+def run(generations, checkpoints, ready_queue=False):
+    """Run the spawner and return the samples taken at each checkpoint.
+
+    Each sample is a tuple of the generation, the reaction count and the
+    traced memory after a garbage collection.
+
+    Arguments:
+        generations: the number of workers to start one after another
+        checkpoints: the number of samples to take after the first
+    Keyword arguments:
+        ready_queue: schedule machines through the ready queue
+    """
+    samples = []
+
+    tracemalloc.start()
+
+    ctl = MachineControl(debug=False, ready_queue=ready_queue)
+    ctl.run(Spawner, generations, checkpoints, samples)
+
+    tracemalloc.stop()
+
+    return samples
+
+
+def check(samples, slack):
+    """Return a list of growth found in the samples of a run.
+
+    The first sample is taken before any worker has started, so the second
+    sample is the reference.
+
+    Arguments:
+        samples: the samples returned by `run'
+        slack: the allowed memory growth in bytes, which covers the samples \
+            themselves
+    """
+    problems = []
+    reference, last = samples[1], samples[-1]
+
+    if last[1] > reference[1]:
+        problems.append('reactions grew from %d to %d' % (reference[1],
+                                                          last[1]))
+
+    if last[2] > reference[2] + slack:
+        problems.append('memory grew from %d to %d' % (reference[2],
+                                                       last[2]))
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--generations', type=int, default=20000)
+    parser.add_argument('--checkpoints', type=int, default=10)
+    parser.add_argument('--ready-queue', action='store_true')
+    parser.add_argument('--slack', type=int, default=4096,
+                        help='allowed memory growth in bytes')
+    args = parser.parse_args()
+
+    samples = run(args.generations, args.checkpoints, args.ready_queue)
+
+    print('%12s %10s %12s' % ('generation', 'reactions', 'memory'))
+    for sample in samples:
+        print('%12d %10d %12d' % sample)
+
+    problems = check(samples, args.slack)
+    for problem in problems:
+        sys.stderr.write(problem + '\n')
+
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
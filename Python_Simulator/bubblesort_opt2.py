@@ -1,13 +1,13 @@
-from simulator import MachineControl, StateMachine
+from simulator import MachineControl, CompiledStateMachine
 
 
-class BubbleSort(StateMachine):
+class BubbleSort(CompiledStateMachine):
     def __init__(self, ctl, ctx, a):
         super().__init__(ctl, ctx)
 
         self.a = a
 
-        self.i = 1
+        self.i = 0
         self.swappers = []
         self.max_changed = 0
         self.changed = False
@@ -22,16 +22,11 @@ class BubbleSort(StateMachine):
         return '<BubbleSort,state=%s>' % (self.current_state.__name__)
 
     def setup(self):
-        if self.i < len(self.a):
-            s = self.start_machine(Swapper, a=self.a, i=self.i)
-
-            self.when_machine_emits('swapped', s, self.swapped)
-            self.when_machine_emits('next', s, self.swap)
+        self.swappers = self.start_machines(
+            Swapper, ((self.a, i) for i in range(1, len(self.a))))
 
-            self.swappers.append(s)
-
-            self.i += 1
-            return self.setup
+        self.when('swapped', self.swapped)
+        self.when('next', self.swap)
 
         return self.setup_swap
 
@@ -77,7 +72,7 @@ class BubbleSort(StateMachine):
         return self.setup_swap
 
 
-class Swapper(StateMachine):
+class Swapper(CompiledStateMachine):
     def __init__(self, ctl, ctx, a, i):
         super().__init__(ctl, ctx)
 
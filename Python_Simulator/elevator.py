@@ -1,6 +1,5 @@
 from simulator import MachineControl, StateMachine
 from random import randint
-import datetime as dt
 
 
 class Elevator(StateMachine):
@@ -24,9 +23,7 @@ class Elevator(StateMachine):
         self.caret_machine = None
         self.caret_class = ElevatorCaret
 
-        self.open_t = dt.timedelta(milliseconds=1500)
-
-        self.timer_end = None
+        self.open_t = 1.5
 
         self.init_state = self.setup
 
@@ -89,10 +86,8 @@ class Elevator(StateMachine):
     def open_doors(self):
         self.lift_is_open = True
 
-        self.timer_end = dt.datetime.now() + self.open_t
-        self.when_machine_emits('timer', self, self.time)
         self.when_machine_emits('timer_end', self, self.move_on)
-        self.emit_to(self, 'timer')
+        self.start_timer(self.open_t, 'timer_end')
 
         return self.listen
 
@@ -114,24 +109,17 @@ class Elevator(StateMachine):
 
         return self.move
 
-    def time(self):
-        if dt.datetime.now() >= self.timer_end:
-            self.emit_to(self, 'timer_end')
-        else:
-            self.emit_to(self, 'timer')
-
 
 class ElevatorCaret(StateMachine):
     def __init__(self, ctl, ctx):
         super().__init__(ctl, ctx)
 
         self.step = 0
-        self.step_t = dt.timedelta(milliseconds=1000)
+        self.step_t = 1.0
         self.position = 0
         self.direction = 0
 
         self.timer_start = None
-        self.timer_end = None
 
         self.init_state = self.setup
 
@@ -142,17 +130,9 @@ class ElevatorCaret(StateMachine):
         self.direction = self.event.value
         self.step = 0
 
-        self.timer_start = dt.datetime.now()
-        self.timer_end = self.timer_start + self.step_t
+        self.timer_start = self.ctl.now()
         self.when_machine_emits('timer', self, self.reached)
-
-        return self.time
-
-    def time(self):
-        if dt.datetime.now() < self.timer_end:
-            return self.time
-
-        self.emit_to(self, 'timer')
+        self.start_timer(self.step_t, 'timer')
 
     def reached(self):
         self.position += self.direction
@@ -170,14 +150,12 @@ class ElevatorKeys(StateMachine):
 
         self.n = n
 
-        self.press_t = dt.timedelta(milliseconds=5000)
+        self.press_t = 5.0
 
         self.i = 0
         self.w = 0
         self.level = 0
 
-        self.timer_end = None
-
         self.init_state = self.press
 
     def setup(self):
@@ -185,16 +163,8 @@ class ElevatorKeys(StateMachine):
         return self.wait
 
     def wait(self):
-        self.timer_end = dt.datetime.now() + self.press_t
         self.when_machine_emits('timer', self, self.press)
-
-        return self.time
-
-    def time(self):
-        if dt.datetime.now() < self.timer_end:
-            return self.time
-
-        self.emit_to(self, 'timer')
+        self.start_timer(self.press_t, 'timer')
 
     def press(self):
         self.level = randint(0, self.n - 1)
@@ -1,7 +1,6 @@
 from simulator import MachineControl, StateMachine
 from elevator import Elevator, ElevatorCaret
 import pygame
-import datetime as dt
 from math import floor
 
 
@@ -23,6 +22,8 @@ class PygameElevator(Elevator):
         self.goals_y = 225
         self.goals_x = 530
 
+        self.frame_t = 1 / 60
+
         self.caret_class = PygameElevatorCaret
         self.key_class = PygameElevatorKeys
 
@@ -61,7 +62,7 @@ class PygameElevator(Elevator):
 
         pygame.display.flip()
 
-        self.emit_to(self, 'render')
+        self.start_timer(self.frame_t, 'render')
 
     def pg_obj_ready(self):
         self.pygame_objects.append(self.event.value)
@@ -77,6 +78,8 @@ class PygameElevatorCaret(ElevatorCaret):
 
         self.difference = None
 
+        self.frame_t = 1 / 60
+
     def setup(self):
         self.numbers = pygame.image.load('simulator/img/elevator_numbers.png')
         self.numbersrect = self.numbers.get_rect()
@@ -89,12 +92,22 @@ class PygameElevatorCaret(ElevatorCaret):
 
         return super().setup()
 
-    def time(self):
-        self.difference = (dt.datetime.now() - self.timer_start) / self.step_t
+    def move(self):
+        super().move()
+
+        self.when_machine_emits('frame', self, self.animate)
+        self.start_timer(self.frame_t, 'frame')
+
+    def animate(self):
+        if self.direction == 0:
+            self.numbersarea.y = (6 - self.position) * 32
+            return
+
+        self.difference = (self.ctl.now() - self.timer_start) / self.step_t
         self.numbersarea.y = (6 - self.position +
                               self.direction * -1 * self.difference) * 32
 
-        return super().time()
+        self.start_timer(self.frame_t, 'frame')
 
 
 class PygameElevatorKeys(StateMachine):
@@ -113,6 +126,8 @@ class PygameElevatorKeys(StateMachine):
         self.keys_size = 50
         self.key = None
 
+        self.poll_t = 1 / 60
+
         self.pg_event = None
 
         self.init_state = self.setup
@@ -125,6 +140,8 @@ class PygameElevatorKeys(StateMachine):
         self.emit_to(self.ctx, 'pg_obj_ready',
                      value=(self.keys, (self.keys_x, self.keys_y)))
 
+        self.when_machine_emits('poll', self, self.handle_event)
+
         return self.handle_event
 
     def handle_event(self):
@@ -133,7 +150,10 @@ class PygameElevatorKeys(StateMachine):
         if self.pg_event.type == pygame.MOUSEBUTTONUP:
             return self.clicked
 
-        return self.handle_event
+        if self.pg_event.type != pygame.NOEVENT:
+            return self.handle_event
+
+        self.start_timer(self.poll_t, 'poll')
 
     def clicked(self):
         if (self.pg_event.pos[0] < self.keys_x or
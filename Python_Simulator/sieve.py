@@ -1,7 +1,7 @@
-from simulator import MachineControl, StateMachine
+from simulator import MachineControl, CompiledStateMachine
 
 
-class Sieve(StateMachine):
+class Sieve(CompiledStateMachine):
     def __init__(self, ctl, ctx, n):
         super().__init__(ctl, ctx)
 
@@ -49,7 +49,7 @@ class Sieve(StateMachine):
         self.emit_to(self.manager, 'new_x', value=self.x)
 
 
-class PickerManager(StateMachine):
+class PickerManager(CompiledStateMachine):
     def __init__(self, ctl, ctx):
         super().__init__(ctl, ctx)
 
@@ -113,7 +113,7 @@ class PickerManager(StateMachine):
             return self.unlisten_pickers
 
 
-class Picker(StateMachine):
+class Picker(CompiledStateMachine):
     def __init__(self, ctl, ctx, x):
         super().__init__(ctl, ctx)
 
@@ -0,0 +1,132 @@
+from simulator import MachineControl, CompiledStateMachine
+
+
+class Sieve(CompiledStateMachine):
+    def __init__(self, ctl, ctx, n):
+        super().__init__(ctl, ctx)
+
+        self.n = n
+
+        self.x = 2
+        self.manager = None
+
+        self.info = [
+            ('n:%d', 'n'),
+            ('x:%d', 'x'),
+        ]
+
+        self.init_state = self.setup
+
+    def __repr__(self):
+        return '<Sieve:n=%d,state=%s>' % (self.n, self.current_state.__name__)
+
+    def setup(self):
+        if self.n < 0:
+            return self.halt
+
+        self.manager = self.start_machine(PickerManager)
+
+        self.when_machine_emits('pass', self.manager, self.prime)
+        self.when_machine_emits('fail', self.manager, self.increment)
+
+        return self.prime
+
+    def prime(self):
+        self.n -= 1
+
+        print('FOUND PRIME %d, %d left' % (self.x, self.n))
+
+        if self.n == 0:
+            return self.halt
+
+        self.emit_to(self.manager, 'new_prime', value=self.x)
+
+        return self.increment
+
+    def increment(self):
+        self.x += 1
+
+        self.emit_to(self.manager, 'new_x', value=self.x)
+
+
+class PickerManager(CompiledStateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.pickers = []
+        self.togo = 0
+        self.current_x = 0
+
+        self.init_state = self.setup
+
+    def __repr__(self):
+        return '<PickerManager:state=%s>' % (self.current_state.__name__)
+
+    def setup(self):
+        self.when_machine_emits('new_prime', self.ctx, self.new_prime)
+        self.when_machine_emits('new_x', self.ctx, self.new_x)
+
+        self.when('pass', self.got_pass, batch=True)
+        self.when('fail', self.got_fail)
+
+    def new_prime(self):
+        self.pickers.append(self.start_machine(Picker, self.event.value))
+
+    def new_x(self):
+        self.togo = len(self.pickers)
+        self.current_x = self.event.value
+
+        self.emit_to_many(self.pickers, 'run', value=self.current_x)
+
+    def got_pass(self):
+        for event in self.events:
+            # Pickers still answer for candidates that already failed.
+            if event.value == self.current_x:
+                self.togo -= 1
+
+        if self.togo == 0:
+            self.emit_to(self.ctx, 'pass')
+
+    def got_fail(self):
+        if self.event.value != self.current_x:
+            return
+
+        self.current_x = 0
+        self.emit_to(self.ctx, 'fail')
+
+
+class Picker(CompiledStateMachine):
+    def __init__(self, ctl, ctx, x):
+        super().__init__(ctl, ctx)
+
+        self.x = x
+        self.count = 0
+
+        self.info = [
+            ('x:%d', 'x'),
+            ('count:%d', 'count'),
+        ]
+
+        self.init_state = self.setup
+
+    def __repr__(self):
+        return '<Picker:x=%d,count=%d,state=%s>' % (
+            self.x, self.count, self.current_state.__name__)
+
+    def setup(self):
+        self.when('run', self.run)
+
+    def run(self):
+        self.count += 1
+
+        if self.count == self.x:
+            self.count = 0
+            self.emit_to(self.ctx, 'fail', value=self.event.value)
+
+        else:
+            self.emit_to(self.ctx, 'pass', value=self.event.value)
+
+
+if __name__ == '__main__':
+    ctl = MachineControl(debug=False, step=False)
+    ctl.run(Sieve, 15)
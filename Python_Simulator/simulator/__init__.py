@@ -1 +1,3 @@
-from .simulator import StateMachine, MachineControl
+from .simulator import StateMachine, CompiledStateMachine, MachineControl
+from .parallel import ParallelMachineControl
+from .asynchronous import AsyncMachineControl
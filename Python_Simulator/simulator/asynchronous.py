@@ -0,0 +1,275 @@
+"""Run purely event-driven programs on an asyncio event loop.
+
+States of machines run by AsyncMachineControl may be coroutines, e.g. to wait
+for I/O. While a machine awaits its state, other machines keep running. Once
+the state is done, the machine transitions to the state it returned, like any
+other state. The `listen' and `halt' states, as well as the reaction API, are
+unchanged.
+
+Classes:
+
+* AsyncMachineControl: manages and schedules state machines on an event loop
+"""
+import asyncio
+import inspect
+import sys
+
+from .simulator import MachineControl, Event, StateMachine
+
+
+class AsyncMachineControl(MachineControl):
+    """Manage and schedule state machines on an asyncio event loop.
+
+    Machines are scheduled through a ready queue, like MachineControl does
+    with `ready_queue' set. A machine whose state returns an awaitable is
+    blocked: it leaves the ready queue until the awaitable is done. Meanwhile,
+    events are still delivered to its inbox.
+
+    When no machine can run, machine control awaits the event loop until a
+    state finishes, a timer goes off or an event is injected. Timers use the
+    event loop's `call_later'.
+    """
+
+    def __init__(self, debug=False, step=False, wait_for_input=False,
+                 yield_every=64):
+        """Initialize an asyncio machine control.
+
+        Keyword Args:
+            debug: opens a window for each state machine showing state \
+            and event information if True (default True)
+            step: allows one to cycle stepwise (default False)
+            wait_for_input: wait for injected events when all machines are \
+            stuck, instead of stopping (default False)
+            yield_every: the number of cycles after which the event loop gets \
+            to run other tasks, even if machines are runnable (default 64)
+        """
+        super().__init__(debug=debug, step=step, ready_queue=True,
+                         wait_for_input=wait_for_input)
+
+        self.yield_every = yield_every
+
+        self.loop = None
+        self.wakeup = None
+        self.blocked = {}
+        self.pending_timers = {}
+        self.error = None
+
+    def run(self, machine_cls, *args, **kwargs):
+        """Start a state machine on a new event loop and run until all
+        machines have halted.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            \*args/\*\*kwargs: any arguments the state machine takes
+        """
+        asyncio.run(self.run_async(machine_cls, *args, **kwargs))
+
+    async def run_async(self, machine_cls, *args, **kwargs):
+        """Start a state machine and run until all machines have halted.
+
+        This coroutine runs on the current event loop.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            \*args/\*\*kwargs: any arguments the state machine takes
+        """
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+        self.ctx = StateMachine(self, None)
+        self.ctx.handle = self.machines.new_handle()
+        self.start_machine(machine_cls, self.ctx, *args, **kwargs)
+
+        try:
+            cycles = 0
+
+            while len(self.machines) > 0:
+                if self.error is not None:
+                    raise self.error
+
+                if self.cycle():
+                    cycles += 1
+                    if cycles % self.yield_every == 0:
+                        await asyncio.sleep(0)
+
+                    continue
+
+                if (not self.blocked and not self.pending_timers
+                        and not self.inputs and not self.wait_for_input):
+                    sys.stderr.write(self.deadlock_report())
+                    break
+
+                self.wakeup.clear()
+                await self.wakeup.wait()
+        finally:
+            for task in self.blocked.values():
+                task.cancel()
+
+            for timer in self.pending_timers:
+                timer.cancel()
+
+            self.reset()
+
+    def cycle(self):
+        """Distribute events, cycle a machine and return whether one ran.
+
+        If the machine's state returns an awaitable, the machine is blocked
+        until it is done. Otherwise it transitions right away.
+        """
+        if self.inputs:
+            self.read_inputs()
+
+        while self.distribute_events():
+            pass
+
+        try:
+            machine = self.ready.popleft()
+        except IndexError:
+            return False
+
+        c_state = machine.current_state
+
+        var_str = None
+        if self.debug:
+            var_str = self.debug_precycle(machine)
+
+        new_state = c_state()
+
+        if inspect.isawaitable(new_state):
+            self.block(machine, c_state, var_str, new_state)
+        else:
+            self.finish(machine, c_state, var_str, new_state)
+
+        if self.step:
+            input('Press enter to step...')
+
+        return True
+
+    def block(self, machine, c_state, var_str, awaitable):
+        """Block a machine until its state's awaitable is done.
+
+        Arguments:
+            machine: the StateMachine
+            c_state: the state that returned the awaitable
+            var_str: the machine's variable string before the state, if \
+                debugging
+            awaitable: the awaitable returned by the state
+        """
+        task = asyncio.ensure_future(awaitable)
+        self.blocked[machine] = task
+
+        def done(task):
+            del self.blocked[machine]
+            self.wakeup.set()
+
+            if task.cancelled():
+                return
+
+            if task.exception() is not None:
+                self.error = task.exception()
+                return
+
+            self.finish(machine, c_state, var_str, task.result())
+
+        task.add_done_callback(done)
+
+    def finish(self, machine, c_state, var_str, new_state):
+        """Transition a machine after its state is done.
+
+        Arguments:
+            machine: the StateMachine
+            c_state: the state that is done
+            var_str: the machine's variable string before the state, if \
+                debugging
+            new_state: the state returned by the state, or None
+        """
+        machine.transition(new_state)
+
+        if not machine.is_suspended and machine in self.machines:
+            self.ready.append(machine)
+
+        if self.debug:
+            self.debug_aftercycle(machine, c_state, machine.current_state,
+                                  var_str)
+
+    def wake(self, machine):
+        """Take a machine out of suspension, and wake up machine control.
+
+        Arguments:
+            machine: the StateMachine an event was delivered to
+        """
+        super().wake(machine)
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def add_timer(self, machine, delay, typ, value=None):
+        """Add a timer for a machine and return it.
+
+        The timer is scheduled on the event loop.
+
+        Arguments:
+            machine: the StateMachine setting the timer
+            delay: the delay in seconds
+            typ: the timer event's type string
+
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+        """
+        event = Event(typ, machine, value=value, destination=machine)
+
+        def fire():
+            del self.pending_timers[timer]
+            self.forget_timer(machine.handle, timer)
+            self.emit(event)
+            self.wakeup.set()
+
+        timer = self.loop.call_later(delay, fire)
+        self.pending_timers[timer] = machine.handle
+        self.machine_timers.setdefault(machine.handle, {})[timer] = timer
+
+        return timer
+
+    def cancel_timer(self, timer):
+        """Cancel a timer, if it has not gone off yet.
+
+        Arguments:
+            timer: a timer, as returned by `add_timer`
+        """
+        timer.cancel()
+
+        handle = self.pending_timers.pop(timer, None)
+        if handle is not None:
+            self.forget_timer(handle, timer)
+
+    def now(self):
+        """Return the current time in seconds, according to the event loop."""
+        return self.loop.time()
+
+    def inject(self, typ, value=None, destination=None):
+        """Emit an event from outside the program.
+
+        This may be called from any thread.
+
+        Arguments:
+            typ: the event's type string
+
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+            destination: the StateMachine the event should end up with \
+                (default None)
+        """
+        super().inject(typ, value=value, destination=destination)
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def reset(self):
+        """Reset machine control, including its event loop state."""
+        super().reset()
+
+        self.loop = None
+        self.wakeup = None
+        self.blocked = {}
+        self.pending_timers = {}
+        self.error = None
@@ -1,51 +1,206 @@
 import tkinter as tk
 from tkinter.scrolledtext import ScrolledText
 from tkinter.font import Font
+from collections import deque
+import atexit
+import codecs
 import sys
 import fcntl
 import os
 import subprocess
 import signal
+import threading
 
 
-class DebugWindow:
-    """Create a Tk window for displaying debug messages.
+class DebugViewer:
+    """Run a single viewer process for any number of debug windows.
 
-    The `Window` class in this script is the actual window. By invoking this
-    file directly, such a window is created. This window reads from stdin. This
-    class does exactly that. It runs this script as a subprocess, linking its
-    stdin to a writable buffer.
-    """
+    The `Window` class in this script is the actual viewer. By invoking this
+    file directly, such a viewer is created. It reads from stdin, on which all
+    debug windows are multiplexed. Each line starts with a window's ID and a
+    character indicating what the line is for:
 
-    def __init__(self, title='State Machine'):
-        """Initialize a debug window.
+    * \`+': a new window, with the rest of the line as its title
+    * \`#': a new title for the window
+    * \`-': the window is closed, it is marked as such in the list
+    * \` ': a line of text for the window
 
-        Opens a Tk window in a subprocess, in text-mode which allows the stdin
-        pipe to be used for text directly.
+    Lines are not written to the pipe right away. They are added to a bounded
+    buffer, which a background thread drains, writing all buffered lines at
+    once. When the buffer is full, either the oldest line is dropped, or the
+    writer waits until the thread catches up. Dropped lines are counted in
+    `dropped`.
+    """
+
+    def __init__(self, buffer_size=10000, overflow='block'):
+        """Start a viewer process.
 
         Keyword arguments:
-            title: the window's initial title (default 'State Machine')
+            buffer_size: the maximum number of buffered lines (default 10000)
+            overflow: what to do with a line when the buffer is full, either \
+                'drop-oldest' or 'block' (default 'block')
         """
+        if overflow not in ('drop-oldest', 'block'):
+            raise ValueError('Unknown overflow policy %r' % (overflow))
+
         self.proc = subprocess.Popen(
             [sys.executable, os.path.realpath(__file__)],
             stdin=subprocess.PIPE, universal_newlines=True)
 
-        self.set_title(title)
+        self.next_id = 0
 
-    def write(self, text):
-        """Write a line to the window.
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.dropped = 0
+
+        self.closed = False
+        self.broken = False
+        self.writing = False
+        self.changed = threading.Condition()
+
+        self.writer = threading.Thread(target=self.drain, daemon=True)
+        self.writer.start()
+
+        # The writer thread does not outlive the interpreter, so buffered
+        # lines are flushed at exit.
+        atexit.register(self.flush)
 
-        The window might have been closed by the user or some different event.
+    def add_window(self, title):
+        """Add a window to the viewer and return its ID.
+
+        Arguments:
+            title: the window's initial title
+        """
+        window_id = self.next_id
+        self.next_id += 1
+
+        self.send(window_id, '+', title)
+
+        return window_id
+
+    def send(self, window_id, kind, text):
+        """Send a line for a window to the viewer.
+
+        The viewer might have been closed by the user or some different event.
         This is ignored.
 
         Arguments:
+            window_id: the window's ID
+            kind: the kind of line, one of \`+', \`#', \`-' and \` '
             text: text excluding newline
         """
-        try:
-            self.proc.stdin.write(text + '\n')
-            self.proc.stdin.flush()
-        except BrokenPipeError:
-            ...
+        if '\n' in text:
+            for line in text.split('\n'):
+                self.send(window_id, kind, line)
+            return
+
+        with self.changed:
+            if self.broken or self.closed:
+                return
+
+            if len(self.buffer) >= self.buffer_size:
+                if self.overflow == 'drop-oldest':
+                    self.buffer.popleft()
+                    self.dropped += 1
+                else:
+                    while (len(self.buffer) >= self.buffer_size
+                           and not self.broken):
+                        self.changed.wait()
+
+            self.buffer.append('%d %s%s' % (window_id, kind, text))
+
+            # The writer thread only waits for an empty buffer.
+            if len(self.buffer) == 1:
+                self.changed.notify_all()
+
+    def drain(self):
+        """Write buffered lines to the pipe until the viewer is closed.
+
+        This runs in the writer thread. All lines buffered at the time are
+        written and flushed at once.
+        """
+        while True:
+            with self.changed:
+                while not self.buffer and not self.closed:
+                    self.changed.wait()
+
+                lines = self.buffer
+                self.buffer = deque()
+                closed = self.closed
+                self.writing = True
+
+                self.changed.notify_all()
+
+            try:
+                if lines:
+                    self.proc.stdin.write('\n'.join(lines) + '\n')
+                    self.proc.stdin.flush()
+
+                if closed:
+                    self.proc.stdin.close()
+            except BrokenPipeError:
+                with self.changed:
+                    self.broken = True
+                    self.writing = False
+                    self.buffer.clear()
+                    self.changed.notify_all()
+
+                return
+
+            with self.changed:
+                self.writing = False
+                self.changed.notify_all()
+
+            if closed:
+                return
+
+    def flush(self):
+        """Wait until all buffered lines are written."""
+        with self.changed:
+            while (self.buffer or self.writing) and not self.broken:
+                self.changed.wait()
+
+    def close(self):
+        """Close the viewer's stdin pipe, once all lines are written.
+
+        This does not actually close the viewer, only the stream. The viewer
+        is kept open so the user can analyse states even after a program is
+        finished.
+        """
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+
+class DebugWindow:
+    """Show debug messages in a window of a viewer.
+
+    Windows share a DebugViewer, so creating one only sends a message to the
+    viewer process. Without a viewer, the window starts its own.
+    """
+
+    def __init__(self, title='State Machine', viewer=None):
+        """Initialize a debug window.
+
+        Keyword arguments:
+            title: the window's initial title (default 'State Machine')
+            viewer: the DebugViewer to show the window in (default a new one)
+        """
+        self.own_viewer = viewer is None
+        if viewer is None:
+            viewer = DebugViewer()
+
+        self.viewer = viewer
+        self.id = viewer.add_window(title)
+
+    def write(self, text):
+        """Write a line to the window.
+
+        Arguments:
+            text: text excluding newline
+        """
+        self.viewer.send(self.id, ' ', text)
 
     def set_title(self, title):
         """Set the window's title.
@@ -53,94 +208,237 @@ class DebugWindow:
         Arguments:
             title: the title
         """
-        self.write('#' + title)
+        self.viewer.send(self.id, '#', title)
 
     def close(self):
-        """Close the window's stdin pipe.
+        """Close the window's stream.
 
-        This does not actually close the window, only the stream. The window is
-        kept open so the user can analyse states even after a program is
-        finished.
+        This does not actually close the window. The window is kept open so
+        the user can analyse states even after a program is finished.
         """
-        try:
-            self.proc.stdin.close()
-        except BrokenPipeError:
-            ...
+        self.viewer.send(self.id, '-', '')
+
+        if self.own_viewer:
+            self.viewer.close()
 
 
 class Window(tk.Tk):
-    """Show a Tk window with scrollable text from stdin.
+    """Show a Tk window with scrollable text per debug window from stdin.
 
-    Checks stdin for a new line every one millisecond. If the line starts with
-    a \`#', the rest of the line is used as a new title for the window.
-    Otherwise, the line is appended to the textfield, including the newline
-    character.
+    Stdin is read whenever data is available on it, through a Tk file
+    handler. Each line is for one of the debug windows, as described by
+    DebugViewer. The windows are listed on the left. The text of the selected
+    one is shown on the right.
     """
 
     def __init__(self):
         """Initialize the window.
 
-        Creates a frame, holding a srollable textfield. Finally reading from
-        stdin is initiated.
+        Creates a list of debug windows next to a frame, which holds a
+        scrollable textfield per debug window. Finally reading from stdin is
+        initiated.
         """
         super().__init__()
 
         self.font = Font(size=20)
 
-        self.title('State Machine')
+        self.title('State Machines')
+
+        self.panes = tk.PanedWindow(self, orient='horizontal')
+        self.panes.pack(fill='both', expand=True)
 
-        self.frame = tk.Frame(self)
-        self.frame.pack(fill='both', expand=True)
+        self.listbox = tk.Listbox(self.panes, exportselection=False)
+        self.listbox.bind('<<ListboxSelect>>', self.select)
+        self.panes.add(self.listbox, width=200)
 
-        self.text = ScrolledText(self.frame, wrap='word', font=self.font)
-        self.text.configure(state='disabled')
-        self.text.pack(side='top', fill='both', expand=True)
-        self.text.bind('<1>', lambda ev: self.text.focus_set())
+        self.frame = tk.Frame(self.panes)
+        self.panes.add(self.frame)
 
-        self.geometry('500x400')
+        self.texts = {}
+        self.titles = {}
+        self.closed = set()
+        self.rows = {}
+        self.ids = []
+        self.shown = None
 
-        self.after(1, self.do_read)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.partial = ''
 
-    def do_read(self):
-        """Try to read a line from stdin."""
-        line = sys.stdin.readline()
+        self.geometry('700x400')
 
-        if line is not None and line != '':
-            self.process_line(line)
+        self.tk.createfilehandler(sys.stdin, tk.READABLE, self.do_read)
 
-        self.after(1, self.do_read)
+    def do_read(self, fh, mask):
+        """Read everything available from stdin and process it.
 
-    def process_line(self, line):
-        """Process a line for debug display.
+        The last line may be incomplete, in which case it is kept until the
+        rest is read. At the end of stdin, it is no longer watched.
 
-        If a line starts with \`#', change the window's title. Otherwise, write
-        the line to the textbox.
+        Arguments:
+            fh: the file handler's file, stdin
+            mask: the file handler's event mask
+        """
+        chunks = []
+
+        while True:
+            try:
+                data = os.read(sys.stdin.fileno(), 1 << 16)
+            except BlockingIOError:
+                break
+
+            if not data:
+                self.tk.deletefilehandler(sys.stdin)
+                break
+
+            chunks.append(data)
+
+        lines = (self.partial + self.decoder.decode(b''.join(chunks))).split(
+            '\n')
+        self.partial = lines.pop()
+
+        self.process_lines(lines)
+
+    def process_lines(self, lines):
+        """Process lines for debug display.
+
+        The text for each debug window is inserted at once, and only its last
+        title is set. Windows are marked as closed after that.
+
+        Arguments:
+            lines: the lines to be processed, excluding newline characters
+        """
+        texts = {}
+        titles = {}
+        closed = []
+
+        for line in lines:
+            window_id, _, line = line.partition(' ')
+            window_id = int(window_id)
+            kind, text = line[:1], line[1:]
+
+            if kind == '+':
+                self.add_window(window_id, text)
+                continue
+
+            # With a dropping viewer, a window's first line may be lost.
+            if window_id not in self.texts:
+                self.add_window(window_id, 'Window %d' % (window_id))
+
+            if kind == '#':
+                titles[window_id] = text
+
+            elif kind == ' ':
+                texts.setdefault(window_id, []).append(text)
+
+            elif kind == '-':
+                closed.append(window_id)
+
+        for window_id, title in titles.items():
+            self.set_title(window_id, title)
+
+        for window_id, text in texts.items():
+            self.write_text(window_id, '\n'.join(text) + '\n')
+
+        for window_id in closed:
+            self.close_window(window_id)
+
+    def add_window(self, window_id, title):
+        """Add a debug window, and show it if it is the first.
 
         Arguments:
-            line: the line to be processed, including newline character
+            window_id: the window's ID
+            title: the window's title
         """
-        if line[0] == '#':
-            self.title(line[1:].rstrip('\n'))
+        text = ScrolledText(self.frame, wrap='word', font=self.font)
+        text.configure(state='disabled')
+        text.bind('<1>', lambda ev: text.focus_set())
+
+        self.texts[window_id] = text
+        self.rows[window_id] = len(self.ids)
+        self.ids.append(window_id)
+        self.listbox.insert('end', '')
+        self.set_title(window_id, title)
 
-        else:
-            self.write_text(line)
+        if self.shown is None:
+            self.listbox.selection_set(0)
+            self.show(window_id)
 
-    def write_text(self, text):
-        """Write text to the end of the textfield.
+    def set_title(self, window_id, title):
+        """Set a debug window's title.
 
         Arguments:
+            window_id: the window's ID
+            title: the title
+        """
+        self.titles[window_id] = title
+
+        i = self.rows[window_id]
+        selected = self.listbox.selection_includes(i)
+
+        label = '%d %s' % (window_id, title)
+        if window_id in self.closed:
+            label += ' (closed)'
+
+        self.listbox.delete(i)
+        self.listbox.insert(i, label)
+
+        if selected:
+            self.listbox.selection_set(i)
+
+        if window_id == self.shown:
+            self.title(title)
+
+    def close_window(self, window_id):
+        """Mark a debug window as closed in the list.
+
+        Its text stays available, so it can still be inspected.
+
+        Arguments:
+            window_id: the window's ID
+        """
+        self.closed.add(window_id)
+        self.set_title(window_id, self.titles[window_id])
+
+    def select(self, event):
+        """Show the debug window selected in the list."""
+        selection = self.listbox.curselection()
+
+        if selection:
+            self.show(self.ids[selection[0]])
+
+    def show(self, window_id):
+        """Show a debug window's text.
+
+        Arguments:
+            window_id: the window's ID
+        """
+        if self.shown is not None:
+            self.texts[self.shown].pack_forget()
+
+        self.texts[window_id].pack(side='top', fill='both', expand=True)
+        self.shown = window_id
+
+        self.title(self.titles[window_id])
+
+    def write_text(self, window_id, text):
+        """Write text to the end of a debug window's textfield.
+
+        Arguments:
+            window_id: the window's ID
             text: the text to be added to the textfield.
         """
-        self.text.configure(state='normal')
+        textfield = self.texts[window_id]
+
+        textfield.configure(state='normal')
 
-        self.text.insert('end', text)
+        textfield.insert('end', text)
 
         # Only autoscroll when at end.
-        if self.text.vbar.get()[1] == 1.0:
-            self.text.pos = self.text.index('end - 1 char')
-            self.text.yview_pickplace('end')
+        if textfield.vbar.get()[1] == 1.0:
+            textfield.pos = textfield.index('end - 1 char')
+            textfield.yview_pickplace('end')
 
-        self.text.configure(state='disabled')
+        textfield.configure(state='disabled')
 
 
 def make_nonblocking(fh):
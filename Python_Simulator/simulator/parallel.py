@@ -0,0 +1,674 @@
+"""Run purely event-driven programs in parallel, on multiple processes.
+
+The machines of a program are partitioned over a number of worker processes.
+Each worker runs its own MachineControl, a PartitionControl, for the machines
+in its partition, much like the Go implementation runs a goroutine per
+machine.
+
+Machines refer to machines in other partitions through a MachineRef. Events
+for such machines, and broadcast events, are sent to the other partitions in
+batches. Every worker sends to a partition through a single channel, so
+events from one machine arrive in the order they were emitted.
+
+A multicast event is sent to each of its destinations in other partitions as
+a directed event. Their acknowledgements are counted by the emitter's
+partition. Named groups are kept per partition, so only machines of the same
+partition are members of a group.
+
+Machines only share state through events. State shared in any other way, like
+the list sorted by the bubblesort swappers, is copied when a machine is
+started in another partition. Such programs should keep their machines in a
+single partition, by means of a placement function.
+
+Classes:
+
+* ParallelMachineControl: starts and coordinates the worker processes
+* PartitionControl: manages and schedules the machines of a partition
+* MachineRef: refers to a machine in another partition
+"""
+import multiprocessing
+from multiprocessing.reduction import ForkingPickler
+import queue
+import sys
+import traceback
+
+from .simulator import MachineControl, Event, StateMachine
+
+
+class ParallelMachineControl:
+    """Run a program on multiple worker processes.
+
+    The first machine is started in the first partition. Every new machine is
+    placed in a partition by the placement function, which by default spreads
+    machines round-robin over all partitions.
+
+    Termination is detected by the coordinator, i.e. this instance in the main
+    process. Workers report their status when they run out of work. When all
+    workers are idle and all sent batches have been received, the coordinator
+    asks all workers for their status twice. If nothing has changed, the
+    program has finished, or is stuck if any machines are left.
+    """
+
+    def __init__(self, workers=None, placement=None, batch=64, **kwargs):
+        """Initialize a parallel machine control.
+
+        Keyword arguments:
+            workers: the number of worker processes (default the number of \
+                CPUs)
+            placement: a function taking a StateMachine subclass and the \
+                number of workers, returning the partition to start it in, or \
+                None to start it in the partition of its context (default \
+                round-robin)
+            batch: the number of cycles a worker runs before sending its \
+                events (default 64)
+            \*\*kwargs: any arguments for each worker's MachineControl
+        """
+        if (kwargs.get('virtual_time') or kwargs.get('step')
+                or kwargs.get('profile') or kwargs.get('trace') is not None):
+            raise ValueError('virtual time, stepping, profiling and tracing '
+                             'are not supported by parallel machine control')
+
+        self.workers = workers or multiprocessing.cpu_count()
+        self.placement = placement
+        self.batch = batch
+        self.kwargs = kwargs
+
+        self.mp = multiprocessing.get_context('fork')
+
+    def run(self, machine_cls, *args, **kwargs):
+        """Start a state machine and run until all machines have halted.
+
+        If the program gets stuck, a report of the machines left in each
+        partition is written to stderr.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            \*args/\*\*kwargs: any arguments the state machine takes
+        """
+        channels = [self.mp.Queue() for _ in range(self.workers)]
+        status = self.mp.Queue()
+
+        procs = [self.mp.Process(target=serve, args=(
+            p, self.workers, channels, status, self.placement, self.batch,
+            self.kwargs, (machine_cls, args, kwargs) if p == 0 else None))
+            for p in range(self.workers)]
+
+        # Forked workers would print anything left in the buffer again.
+        sys.stdout.flush()
+
+        for proc in procs:
+            proc.start()
+
+        try:
+            live = self.coordinate(channels, status)
+
+            if live > 0:
+                for channel in channels:
+                    channel.put(('report',))
+
+                reports = [self.receive(status, 'report')
+                           for _ in range(self.workers)]
+
+                sys.stderr.write('Deadlock: %d machine(s) are left.\n' % (
+                    live))
+                for report in sorted(reports):
+                    sys.stderr.write(report[2])
+        finally:
+            for channel in channels:
+                channel.put(('stop',))
+
+            for proc in procs:
+                proc.join()
+
+    def coordinate(self, channels, status):
+        """Wait until the program has terminated and return the live count.
+
+        Arguments:
+            channels: each partition's inbound queue
+            status: the coordinator's inbound queue
+        """
+        statuses = {}
+        wave = 0
+
+        while True:
+            msg = self.receive(status, 'status')
+            statuses[msg[1]] = msg[2:]
+
+            if len(statuses) < self.workers or not quiet(statuses.values()):
+                continue
+
+            # Probe twice, to make sure no batch was underway unnoticed.
+            counts = None
+            for _ in range(2):
+                wave += 1
+                for channel in channels:
+                    channel.put(('probe', wave))
+
+                probes = {}
+                while len(probes) < self.workers:
+                    msg = self.receive(status)
+
+                    if msg[0] == 'probe' and msg[2] == wave:
+                        probes[msg[1]] = msg[3:]
+                    elif msg[0] == 'status':
+                        statuses[msg[1]] = msg[2:]
+
+                if not quiet(probes.values()) or (
+                        counts is not None and counts != probes):
+                    break
+
+                counts = probes
+            else:
+                return sum(c[3] for c in counts.values())
+
+    def receive(self, status, kind=None):
+        """Return the next message for the coordinator.
+
+        Errors in workers are raised as a RuntimeError.
+
+        Arguments:
+            status: the coordinator's inbound queue
+
+        Keyword arguments:
+            kind: the kind of message expected (default any)
+        """
+        while True:
+            msg = status.get()
+
+            if msg[0] == 'error':
+                raise RuntimeError('Error in partition %d:\n%s' % (
+                    msg[1], msg[2]))
+
+            if kind is None or msg[0] == kind:
+                return msg
+
+
+def quiet(statuses):
+    """Return whether all workers are idle and all batches are received.
+
+    Arguments:
+        statuses: tuples of idle, sent, received and live counts
+    """
+    statuses = list(statuses)
+
+    return (all(s[0] for s in statuses)
+            and sum(s[1] for s in statuses) == sum(s[2] for s in statuses))
+
+
+def serve(partition, workers, channels, status, placement, batch, kwargs,
+          first):
+    """Run a worker process.
+
+    Arguments:
+        partition: the worker's partition number
+        workers: the number of partitions
+        channels: each partition's inbound queue
+        status: the coordinator's inbound queue
+        placement: the placement function, or None
+        batch: the number of cycles to run between sending events
+        kwargs: any arguments for MachineControl
+        first: the first machine's class and arguments, or None
+    """
+    try:
+        ctl = PartitionControl(partition, workers, channels, status,
+                               placement=placement, batch=batch, **kwargs)
+
+        if first is not None:
+            machine_cls, args, kw = first
+            ctl.add_machine(machine_cls(ctl, ctl.ctx, *args, **kw),
+                            ctl.new_handle(partition))
+
+        ctl.serve()
+    except Exception:
+        status.put(('error', partition, traceback.format_exc()))
+
+
+class MachineRef:
+    """Refer to a machine in another partition.
+
+    A reference can be used like a machine to send events to, or to react to
+    events of. There is one reference per machine in each partition, so they
+    can be compared like machines.
+    """
+
+    def __init__(self, handle):
+        """Initialize a reference.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        self.handle = handle
+        self.in_flight = 0
+        self.halted = False
+
+    def __repr__(self):
+        return '<MachineRef:handle=%d>' % (self.handle)
+
+
+class PartitionControl(MachineControl):
+    """Manage and schedule the machines of a partition.
+
+    Handles are unique over all partitions, and tell which partition a machine
+    is in: the partition number is the handle modulo the number of partitions.
+    The first machine's context has handle 0 in every partition.
+
+    Events for machines in other partitions and broadcast events are added to
+    a batch for each other partition. Batches are sent after a number of
+    cycles, or when the partition runs out of work.
+    """
+
+    def __init__(self, partition, workers, channels, status, placement=None,
+                 batch=64, **kwargs):
+        """Initialize a partition's machine control.
+
+        A ready queue is used by default.
+
+        Arguments:
+            partition: the partition number
+            workers: the number of partitions
+            channels: each partition's inbound queue
+            status: the coordinator's inbound queue
+
+        Keyword arguments:
+            placement: the placement function (default round-robin)
+            batch: the number of cycles to run between sending events \
+                (default 64)
+            \*\*kwargs: any arguments for MachineControl
+        """
+        kwargs.setdefault('ready_queue', True)
+        super().__init__(**kwargs)
+
+        self.partition = partition
+        self.workers = workers
+        self.channels = channels
+        self.status = status
+        self.placement = placement
+        self.batch = batch
+
+        self.refs = {}
+        self.outboxes = [[] for _ in range(workers)]
+        self.halted_notices = []
+        self.handle_n = 0
+        self.placed_n = partition
+
+        self.sent = 0
+        self.received = 0
+        self.stopped = False
+
+        self.ctx = StateMachine(self, None)
+        self.ctx.handle = 0
+
+    def new_handle(self, partition):
+        """Return a new handle for a machine in a partition.
+
+        Handles encode the partition that allocates it as well, so partitions
+        do not need to coordinate.
+
+        Arguments:
+            partition: the partition the machine will be in
+        """
+        self.handle_n += 1
+
+        return ((self.handle_n * self.workers + self.partition)
+                * self.workers + partition)
+
+    def place(self, machine_cls, ctx):
+        """Return the partition to start a machine in.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            ctx: the state machine that starts the new machine
+        """
+        if self.placement is None:
+            self.placed_n += 1
+            return self.placed_n % self.workers
+
+        partition = self.placement(machine_cls, self.workers)
+
+        if partition is None:
+            return self.partition
+
+        return partition
+
+    def start_machine(self, machine_cls, ctx, *args, **kwargs):
+        """Start a state machine in some partition.
+
+        If the machine is placed in another partition, it is started there
+        and a reference to it is returned.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            ctx: the state machine that starts this new machine
+            \*args/\*\*kwargs: any arguments the state machine takes
+        """
+        partition = self.place(machine_cls, ctx)
+        handle = self.new_handle(partition)
+
+        if partition == self.partition:
+            return self.add_machine(machine_cls(self, ctx, *args, **kwargs),
+                                    handle)
+
+        self.outboxes[partition].append(
+            ('spawn', handle, machine_cls, ctx.handle, args, kwargs))
+
+        return self.ref(handle)
+
+    def start_machines(self, machine_cls, ctx, args_iterable, **kwargs):
+        """Start many state machines, each in some partition.
+
+        Every machine is placed on its own, so they are started one by one.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            ctx: the state machine that starts these new machines
+            args_iterable: a tuple of positional arguments for each machine
+            \*\*kwargs: any keyword arguments every machine takes
+        """
+        return [self.start_machine(machine_cls, ctx, *args, **kwargs)
+                for args in args_iterable]
+
+    def ref(self, handle):
+        """Return the reference to a machine in another partition.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        try:
+            return self.refs[handle]
+        except KeyError:
+            ref = self.refs[handle] = MachineRef(handle)
+            return ref
+
+    def resolve(self, handle):
+        """Return the machine or reference for a handle.
+
+        None is returned for local machines that have halted.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        if handle == 0:
+            return self.ctx
+
+        if handle % self.workers == self.partition:
+            return self.machines.get(handle)
+
+        return self.ref(handle)
+
+    def describe(self, handle):
+        """Return a description of a machine, possibly in another partition.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        if handle != 0 and handle % self.workers != self.partition:
+            return 'machine %d in partition %d' % (
+                handle, handle % self.workers)
+
+        return super().describe(handle)
+
+    def is_halted(self, machine):
+        """Return whether a machine, possibly in another partition, halted.
+
+        Arguments:
+            machine: the StateMachine or MachineRef to check
+        """
+        if isinstance(machine, MachineRef):
+            return machine.halted
+
+        return super().is_halted(machine)
+
+    def deliver(self, event):
+        """Deliver an event, sending it to other partitions if needed.
+
+        Broadcast events of local machines are sent to all other partitions.
+        Events from other partitions are only delivered locally.
+
+        Arguments:
+            event: the Event to deliver
+        """
+        if isinstance(event.emitter, MachineRef):
+            super().deliver(event)
+            return
+
+        destination = event.destination
+
+        if destination is None:
+            msg = self.encode(event)
+            for partition, outbox in enumerate(self.outboxes):
+                if partition != self.partition:
+                    outbox.append(msg)
+
+            super().deliver(event)
+        elif isinstance(destination, MachineRef):
+            if event.ack:
+                if destination.halted:
+                    event.emitter.acks.pop(event.n, None)
+                else:
+                    self.await_ack(event, destination)
+
+            self.outboxes[destination.handle % self.workers].append(
+                self.encode(event))
+            self.release(event)
+        else:
+            super().deliver(event)
+
+    def deliver_one(self, event, machine):
+        """Deliver a multicast event to one machine, possibly in another
+        partition.
+
+        Arguments:
+            event: the multicast Event
+            machine: one of the event's destinations
+        """
+        if isinstance(machine, MachineRef):
+            if machine.halted:
+                return False
+
+            self.outboxes[machine.handle % self.workers].append(
+                self.encode(event, machine))
+
+            if event.ack:
+                self.await_ack(event, machine)
+
+            return True
+
+        return super().deliver_one(event, machine)
+
+    def encode(self, event, destination=None):
+        """Return a message for sending an event to another partition.
+
+        Arguments:
+            event: the Event to send
+
+        Keyword arguments:
+            destination: the destination to send a multicast event to \
+                (default the event's destination)
+        """
+        if destination is None:
+            destination = event.destination
+
+        return ('event', event.typ, event.value, event.emitter.handle,
+                None if destination is None else destination.handle,
+                event.ack, event.n, event.acked)
+
+    def remove_machine(self, machine):
+        """Remove a halted machine and let the other partitions know.
+
+        The notice is sent after the machine's last events. Only machines in
+        this partition are halted along with their context.
+
+        Arguments:
+            machine: the halted StateMachine
+        """
+        super().remove_machine(machine)
+
+        self.halted_notices.append(('halted', machine.handle))
+
+    def quiesce(self):
+        """Keep serving, as only the coordinator can tell the program is stuck.
+        """
+        return True
+
+    def runnable(self):
+        """Return whether any machine can run, or any timer is due."""
+        return bool(self.awake or self.event_buss or (
+            self.timers and self.timers[0][0] <= self.now()))
+
+    def serve(self):
+        """Run the partition until the coordinator stops it.
+
+        Cycles are run in batches, in between which messages from other
+        partitions are received and events are sent. When out of work, the
+        partition reports to the coordinator and waits for messages or the
+        next timer.
+        """
+        while not self.stopped:
+            for _ in range(self.batch):
+                if not self.runnable():
+                    break
+
+                self.cycle()
+
+            self.flush()
+
+            if self.runnable():
+                self.receive(block=False)
+                continue
+
+            self.report('status')
+            self.receive(block=True)
+
+    def flush(self):
+        """Send all batches to the other partitions.
+
+        Batches are pickled here rather than by the queue's feeder thread, so
+        a value that cannot be pickled raises an error in this partition.
+        """
+        while self.distribute_events():
+            pass
+
+        if self.halted_notices:
+            for partition, outbox in enumerate(self.outboxes):
+                if partition != self.partition:
+                    outbox.extend(self.halted_notices)
+
+            self.halted_notices = []
+
+        for partition, outbox in enumerate(self.outboxes):
+            if outbox:
+                self.channels[partition].put(
+                    bytes(ForkingPickler.dumps(outbox)))
+                self.outboxes[partition] = []
+                self.sent += 1
+
+    def report(self, kind, *extra):
+        """Send this partition's status to the coordinator.
+
+        The partition is idle if no machine can run and no timer is pending,
+        as a timer that is not due yet still makes for work later on.
+
+        Arguments:
+            kind: the kind of message
+            \*extra: any values to send before the status
+        """
+        idle = not self.runnable() and not self.machine_timers
+
+        self.status.put((kind, self.partition) + extra + (
+            idle, self.sent, self.received, len(self.machines)))
+
+    def receive(self, block):
+        """Process all messages that have arrived.
+
+        Arguments:
+            block: whether to wait for a message, or until the next timer
+        """
+        timeout = None
+        if self.timers:
+            timeout = max(0, self.timers[0][0] - self.now())
+
+        try:
+            msg = self.channels[self.partition].get(block, timeout)
+        except queue.Empty:
+            return
+
+        while True:
+            self.process(msg)
+
+            try:
+                msg = self.channels[self.partition].get_nowait()
+            except queue.Empty:
+                return
+
+    def process(self, msg):
+        """Process a batch from another partition or a coordinator message.
+
+        Arguments:
+            msg: a pickled list of messages, or a message tuple
+        """
+        if isinstance(msg, tuple):
+            if msg[0] == 'probe':
+                self.flush()
+                self.report('probe', msg[1])
+            elif msg[0] == 'report':
+                report = ''
+                if len(self.machines) > 0:
+                    report = 'Partition %d:\n%s' % (
+                        self.partition, self.deadlock_report())
+                self.status.put(('report', self.partition, report))
+            elif msg[0] == 'stop':
+                self.stopped = True
+
+            return
+
+        self.received += 1
+
+        for item in ForkingPickler.loads(msg):
+            if item[0] == 'event':
+                self.receive_event(*item[1:])
+            elif item[0] == 'spawn':
+                _, handle, machine_cls, ctx, args, kwargs = item
+                self.add_machine(
+                    machine_cls(self, self.resolve(ctx), *args, **kwargs),
+                    handle)
+            elif item[0] == 'halted':
+                ref = self.ref(item[1])
+                ref.halted = True
+                self.leave_groups(ref)
+                self.abandon_acks(ref)
+
+                if ref.in_flight == 0:
+                    self.purge_emitter_reactions(ref)
+
+    def receive_event(self, typ, value, emitter, destination, ack, n, acked):
+        """Deliver an event from another partition.
+
+        Arguments:
+            typ: the event's type string
+            value: the event's value
+            emitter: the emitter's handle
+            destination: the destination's handle, or None
+            ack: whether an acknowledgement is requested
+            n: the event's number in its emitter's partition
+            acked: the number of the event this acknowledges, or None
+        """
+        if acked is not None:
+            if self.pending_acks:
+                self.settle_ack(emitter, destination, acked)
+
+            if self.multicast_acks and not self.count_ack(destination, acked):
+                return
+
+        if destination is not None:
+            destination = self.resolve(destination)
+
+            if destination is None:
+                return
+
+        event = Event(typ, self.ref(emitter), value=value,
+                      destination=destination, ack=ack)
+        event.n = n
+        event.acked = acked
+
+        event.emitter.in_flight += 1
+        self.deliver(event)
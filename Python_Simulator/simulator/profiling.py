@@ -0,0 +1,166 @@
+"""Collect per-class and per-state statistics of a run.
+
+Profiling is opt-in, through MachineControl's `profile` argument. Without it,
+no profiling code runs at all.
+
+Classes:
+
+* Profiler: counts cycles, time and events of state machines
+"""
+import time
+
+
+class Profiler:
+    """Count cycles, time and events of state machines.
+
+    Machines are profiled by replacing their `cycle` method with one that
+    measures it. The machine's state before the cycle determines what is
+    counted:
+
+    * Every state counts cycles, and cumulative and maximum wall time.
+    * If the machine was listening and took an event from its inbox, the
+      event counts as received. If it had no reaction, it counts as ignored,
+      unless the machine skipped ignored events. Then all events it
+      discarded count as skipped instead.
+    * If the machine suspended, the time until it cycles again counts as
+      time spent suspended.
+
+    Counters are kept per class and per state.
+    """
+
+    def __init__(self):
+        """Initialize a profiler without any counters."""
+        self.states = {}
+        self.classes = {}
+        self.suspended_at = {}
+
+    def counters(self, cls_name):
+        """Return the event counters of a class, creating them if needed.
+
+        Arguments:
+            cls_name: the class name
+        """
+        try:
+            return self.classes[cls_name]
+        except KeyError:
+            counters = self.classes[cls_name] = {
+                'received': 0,
+                'ignored': 0,
+                'skipped': 0,
+                'suspended_time': 0.0,
+            }
+            return counters
+
+    def wrap(self, machine):
+        """Profile a machine.
+
+        Arguments:
+            machine: the StateMachine to profile
+        """
+        cycle = machine.cycle
+        cls_name = type(machine).__name__
+        counters = self.counters(cls_name)
+        states = self.states
+        suspended_at = self.suspended_at
+        perf_counter = time.perf_counter
+
+        def profiled_cycle():
+            started = perf_counter()
+
+            since = suspended_at.pop(machine, None)
+            if since is not None:
+                counters['suspended_time'] += started - since
+
+            state = machine.current_state.__name__
+            listening = state == 'listen'
+            skipped = machine.skipped
+
+            cycle()
+
+            finished = perf_counter()
+            elapsed = finished - started
+
+            try:
+                stats = states[cls_name, state]
+            except KeyError:
+                stats = states[cls_name, state] = [0, 0.0, 0.0]
+
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+            if listening:
+                if machine.is_suspended:
+                    suspended_at[machine] = finished
+                else:
+                    counters['received'] += 1
+                    skipped = machine.skipped - skipped
+
+                    if skipped:
+                        counters['skipped'] += skipped
+                    elif machine.ctl.react_event is None:
+                        counters['ignored'] += 1
+
+        machine.cycle = profiled_cycle
+
+    def forget(self, machine):
+        """Stop profiling a halted machine.
+
+        A machine halted along with its context does not cycle again, so any
+        time it spent suspended is counted now.
+
+        Arguments:
+            machine: the halted StateMachine
+        """
+        since = self.suspended_at.pop(machine, None)
+
+        if since is not None:
+            counters = self.counters(type(machine).__name__)
+            counters['suspended_time'] += time.perf_counter() - since
+
+    def stats(self):
+        """Return the statistics as a dictionary, keyed by class name.
+
+        For each class, the totals of its states are given, as well as a
+        dictionary of the statistics of each state, keyed by name.
+        """
+        result = {}
+
+        for cls_name, counters in self.classes.items():
+            result[cls_name] = dict(counters, cycles=0, time=0.0,
+                                    max_time=0.0, states={})
+
+        for (cls_name, state), (cycles, total, max_time) in (
+                self.states.items()):
+            stats = result[cls_name]
+
+            stats['states'][state] = {
+                'cycles': cycles,
+                'time': total,
+                'max_time': max_time,
+            }
+
+            stats['cycles'] += cycles
+            stats['time'] += total
+            stats['max_time'] = max(stats['max_time'], max_time)
+
+        return result
+
+    def report(self):
+        """Return the statistics as a printable table."""
+        lines = ['%-24s %10s %10s %10s %9s %9s %9s %10s' % (
+            'class/state', 'cycles', 'time', 'max', 'received', 'ignored',
+            'skipped', 'suspended')]
+
+        for cls_name, stats in sorted(self.stats().items()):
+            lines.append('%-24s %10d %10.4f %10.6f %9d %9d %9d %10.4f' % (
+                cls_name, stats['cycles'], stats['time'], stats['max_time'],
+                stats['received'], stats['ignored'], stats['skipped'],
+                stats['suspended_time']))
+
+            for state, s in sorted(stats['states'].items()):
+                lines.append('  %-22s %10d %10.4f %10.6f' % (
+                    state, s['cycles'], s['time'], s['max_time']))
+
+        return '\n'.join(lines) + '\n'
@@ -5,18 +5,33 @@ University of Amsterdam, by Bas van den Heuvel. It follows all concepts
 introduced in this thesis. The purpose is to be able to test and refine those
 concepts.
 
-The scheduling method is deterministicly sequential. No concurrent execution is
-implemented.
+The scheduling method is deterministicly sequential. For parallel execution on
+multiple processes, see the `parallel` module.
 
 Classes:
 
 * MachineControl: manages and schedules state machines and events
+* MachineRegistry: keeps track of live state machines by integer handle
 * Event: event for communication between state machines
+* Inbox: queue of events delivered to a machine, with removal by type
+* BatchReaction: reaction receiving all queued events it matches at once
 * StateMachine: superclass for all possible state machines
+* CompiledStates: metaclass numbering the states of state machine classes
+* CompiledStateMachine: state machine superclass with precomputed dispatch
 """
 from collections import deque as queue
+import gc
+import heapq
+import inspect
+from operator import is_
+import sys
+import threading
+import time
+from types import MethodType
 
-from .debug_window import DebugWindow
+from .debug_window import DebugViewer, DebugWindow
+from .profiling import Profiler
+from .trace import TraceWriter
 
 
 class MachineControl:
@@ -33,14 +48,74 @@ class MachineControl:
     It can be said that there is no event scheduling. Before each state cycle,
     all events in the event buss are distributed to their respective state
     machines.
+
+    A machine's turn may last more than one state. With a quantum of K, a
+    machine keeps running the states it returns until it is about to listen
+    or halt, or has run K states. Events are still distributed between those
+    states, but the rest of the scheduling work is done once per turn. A
+    quantum of 1 runs a single state per turn.
+
+    Machines that receive many events they do not react to can skip them:
+    with `skip_ignored` set, listening discards events until one has a
+    reaction or the inbox is empty, all in one cycle.
+
+    Optionally, a ready queue is used instead. Only machines that are not
+    suspended are in this queue, and a suspended machine is only enqueued
+    again once an event is delivered to it. The cost of a cycle then depends
+    on the number of runnable machines instead of the total.
+
+    The reaction maps are accompanied by reverse indices, which keep track of
+    the reactions of each machine and of the reactions to each machine's
+    events. When a machine halts, its own reactions are removed right away.
+    Reactions to its events are removed once none of its events are left in
+    the event buss or any inbox.
+
+    Broadcast events are routed through the reaction maps, which double as a
+    subscription index. A suspended machine only receives a broadcast if it
+    has a reaction to it. Machines that are awake still receive every
+    broadcast, as they may add reactions before reading their inbox.
+
+    Timers are kept in a heap, ordered by deadline. A timer's event is emitted
+    once its deadline has passed. When all machines are suspended and no
+    events are left, machine control waits for the next deadline. With a
+    virtual clock, it does not actually wait, but jumps to the deadline
+    instead.
+
+    If no timers are left either, no machine can ever run again, unless an
+    event is injected from outside the program. Machine control then either
+    waits for such input, or stops and reports which machines are stuck.
+
+    Acknowledgements are delivered straight to the emitter of the
+    acknowledged event, bypassing the event buss. The emitter's reaction to
+    it only applies to that one event, and is removed once consumed.
+
+    An event can be sent to many machines at once, e.g. to a named group of
+    machines. All of them receive the same Event object. If it requires
+    acknowledgement, the acknowledgements are counted, and only the last one
+    is delivered to the emitter, as a single completion event.
+
+    The machines form a tree, through their contexts. When a machine halts,
+    its children that are suspended and would halt on its \`halt' event are
+    halted right away, breadth first, instead of being woken up to do so.
+    Each of them still emits its own \`halt' event.
+
+    Optionally, machines are profiled. Statistics per class and per state are
+    available through `stats`, and are printed at the end of a run.
+
+    For runs with many machines, cycles and events can be recorded to a
+    binary trace file instead of debug windows. See the `trace` and
+    `trace_reader` modules.
     """
 
-    def __init__(self, debug=False, step=False):
+    def __init__(self, debug=False, step=False, ready_queue=False,
+                 virtual_time=False, wait_for_input=False, profile=False,
+                 trace=None, quantum=1, skip_ignored=False,
+                 debug_buffer_size=10000, debug_overflow='block'):
         """Initialize a machine control.
 
-        It setups up a machine list, which in this implementation is a queue.
-        Reaction maps are created as dictionaries, and the event buss is
-        another queue.
+        It setups up a machine registry and a queue for scheduling them.
+        Reaction maps are created as dictionaries, keyed by machine handles,
+        and the event buss is another queue.
 
         The `ctx` variable is not yet set. This happens when the simulator is
         started.
@@ -49,31 +124,90 @@ class MachineControl:
             debug: opens a window for each state machine showing state \
             and event information if True (default True)
             step: allows one to cycle stepwise (default False)
+            ready_queue: only schedule machines that are not suspended \
+            (default False)
+            virtual_time: use a virtual clock for timers, which skips idle \
+            time (default False)
+            wait_for_input: wait for injected events when all machines are \
+            stuck, instead of stopping (default False)
+            profile: count cycles, time and events per machine class and \
+            state (default False)
+            trace: the path of a file to record a binary trace of each run \
+            to (default None)
+            quantum: the maximum number of states a machine runs per turn, \
+            stopping early at \`listen' or \`halt' (default 1)
+            skip_ignored: let listening discard events without a reaction \
+            until it finds one, instead of taking a cycle per event \
+            (default False)
+            debug_buffer_size: the maximum number of lines buffered for the \
+            debug viewer (default 10000)
+            debug_overflow: what to do with a debug line when the buffer is \
+            full, either 'drop-oldest' or 'block' (default 'block')
         """
-        self.machines = queue()
+        if quantum < 1:
+            raise ValueError('The quantum must be at least 1')
+
+        self.machines = MachineRegistry()
+        self.rotation = queue()
+        self.ready = queue()
+        self.awake = set()
 
         self.event_reactions = {}
         self.machine_reactions = {}
 
+        self.event_keys = {}
+        self.machine_keys = {}
+        self.emitter_keys = {}
+
         self.event_buss = queue()
 
+        self.children = {}
+
+        self.ack_types = {}
+        self.multicast_acks = {}
+        self.pending_acks = {}
+
+        self.groups = {}
+        self.group_keys = {}
+
+        self.timers = []
+        self.timer_n = 0
+        self.machine_timers = {}
+        self.virtual_time = virtual_time
+        self.virtual_now = 0.0
+
+        self.inputs = queue()
+        self.input_ready = threading.Event()
+        self.wait_for_input = wait_for_input
+
         self.ctx = None
 
         self.debug = debug
         self.react_event = None
         self.step = step
+        self.ready_queue = ready_queue
+        self.quantum = quantum
+        self.skip_ignored = skip_ignored
         self.event_n = 0
 
+        self.profiler = Profiler() if profile else None
+
+        self.trace = trace
+        self.tracer = None
+
         if debug:
+            self.debug_viewer = DebugViewer(buffer_size=debug_buffer_size,
+                                            overflow=debug_overflow)
             self.debug_windows = {}
 
     def start_machine(self, machine_cls, ctx, *args, **kwargs):
         """Start a state machine.
 
-        Initializes a machine, given arbitrary arguments, and adds it to the
-        machine queue. After this, event reaction to \`halt' is added.
+        Initializes a machine, given arbitrary arguments, registers it under a
+        new handle and adds it to the machine queue. After this, event reaction
+        to \`halt' is added.
 
-        If debugging is turned on, this also starts a debug window, able to
+        If debugging is turned on, this also adds a debug window, able to
         show state and event information.
 
         Arguments:
@@ -81,16 +215,112 @@ class MachineControl:
             ctx: the state machine that starts this new machine
             \*args/\*\*kwargs: any arguments the state machine takes
         """
-        machine = machine_cls(self, ctx, *args, **kwargs)
+        return self.add_machine(machine_cls(self, ctx, *args, **kwargs))
+
+    def start_machines(self, machine_cls, ctx, args_iterable, **kwargs):
+        """Start many state machines of a class at once, and return them.
+
+        This is equivalent to starting the machines one by one, but they are
+        registered and scheduled in batches, and their \`halt' reactions are
+        added to the reaction maps at once.
+
+        The garbage collector is paused meanwhile. Otherwise, it would
+        repeatedly scan the growing population of new objects.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            ctx: the state machine that starts these new machines
+            args_iterable: a tuple of positional arguments for each machine
+            \*\*kwargs: any keyword arguments every machine takes
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            machines = [machine_cls(self, ctx, *args, **kwargs)
+                        for args in args_iterable]
+            self.add_machines(machines, ctx)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        return machines
+
+    def add_machines(self, machines, ctx):
+        """Register and schedule initialized state machines with one context.
+
+        Arguments:
+            machines: a list of new StateMachines
+            ctx: the machines' context
+        """
+        if self.debug or self.profiler is not None or self.tracer is not None:
+            for machine in machines:
+                self.add_machine(machine)
+
+            return
+
+        registry = self.machines
+        handles = []
+
+        for machine in machines:
+            machine.current_state = machine.init_state
+            handles.append(registry.add(machine))
+
+        self.awake.update(machines)
+        self.children.setdefault(ctx.handle, {}).update(zip(handles, machines))
+
+        if self.ready_queue:
+            self.ready.extend(machines)
+        else:
+            self.rotation.extend(machines)
+
+        if self.is_halted(ctx) and ctx.in_flight == 0:
+            return
+
+        index = ('halt', ctx.handle)
+
+        if index not in self.machine_reactions:
+            self.machine_reactions[index] = {}
+            self.emitter_keys.setdefault(ctx.handle, set()).add('halt')
+
+        self.machine_reactions[index].update(
+            zip(handles, [machine.halt for machine in machines]))
+
+        self.machine_keys.update((handle, {index}) for handle in handles)
+
+    def add_machine(self, machine, handle=None):
+        """Register and schedule an initialized state machine.
+
+        Arguments:
+            machine: the new StateMachine
+
+        Keyword arguments:
+            handle: the handle to register the machine under (default a new \
+                handle)
+        """
         machine.current_state = machine.init_state
 
         if self.debug:
             self.debug_windows[machine] = DebugWindow(
-                title=machine_cls.__name__)
+                title=type(machine).__name__, viewer=self.debug_viewer)
 
-        self.machines.append(machine)
+        if self.profiler is not None:
+            self.profiler.wrap(machine)
 
-        self.add_machine_reaction('halt', ctx, machine, machine.halt)
+        self.machines.add(machine, handle)
+        self.awake.add(machine)
+        self.children.setdefault(machine.ctx.handle, {})[machine.handle] = (
+            machine)
+
+        if self.tracer is not None:
+            self.tracer.machine(machine)
+
+        if self.ready_queue:
+            self.ready.append(machine)
+        else:
+            self.rotation.append(machine)
+
+        self.add_machine_reaction('halt', machine.ctx, machine, machine.halt)
 
         return machine
 
@@ -102,10 +332,14 @@ class MachineControl:
             reactor: the StateMachine that should react
             state: the state the machine should transition to, a method
         """
+        check_registered(reactor)
+
         if typ not in self.event_reactions:
             self.event_reactions[typ] = {}
 
-        self.event_reactions[typ][reactor] = state
+        self.event_reactions[typ][reactor.handle] = state
+
+        self.event_keys.setdefault(reactor.handle, set()).add(typ)
 
     def remove_event_reaction(self, typ, reactor):
         """Remove a reaction to an event.
@@ -115,25 +349,43 @@ class MachineControl:
             reactor: the StateMachine that should ignore the event
         """
         try:
-            del self.event_reactions[typ][reactor]
+            reactions = self.event_reactions[typ]
+            del reactions[reactor.handle]
         except KeyError:
-            pass
+            return
+
+        if not reactions:
+            del self.event_reactions[typ]
+
+        self.event_keys[reactor.handle].discard(typ)
 
     def add_machine_reaction(self, typ, emitter, reactor, state):
         """Add a reaction to a state machine's event.
 
+        If the emitter has halted and none of its events are left, the
+        reaction could never happen and is not added.
+
         Arguments:
             typ: the event's type string
             emitter: the event's emitting StateMachine
             reactor: the StateMachine that should react
             state: the state the machine should transition to, a method
         """
-        index = (typ, emitter)
+        check_registered(emitter)
+        check_registered(reactor)
+
+        if self.is_halted(emitter) and emitter.in_flight == 0:
+            return
+
+        index = (typ, emitter.handle)
 
         if index not in self.machine_reactions:
             self.machine_reactions[index] = {}
+            self.emitter_keys.setdefault(emitter.handle, set()).add(typ)
+
+        self.machine_reactions[index][reactor.handle] = state
 
-        self.machine_reactions[index][reactor] = state
+        self.machine_keys.setdefault(reactor.handle, set()).add(index)
 
     def remove_machine_reaction(self, typ, emitter, reactor):
         """Remove a reaction to a state machine's event.
@@ -143,12 +395,159 @@ class MachineControl:
             emitter: the event's emitting StateMachine
             reactor: the StateMachine that should ignore the event
         """
-        index = (typ, emitter)
+        index = (typ, emitter.handle)
 
         try:
-            del self.machine_reactions[index][reactor]
+            reactions = self.machine_reactions[index]
+            del reactions[reactor.handle]
         except KeyError:
-            pass
+            return
+
+        if not reactions:
+            del self.machine_reactions[index]
+            self.emitter_keys[emitter.handle].discard(typ)
+
+        self.machine_keys[reactor.handle].discard(index)
+
+    def join_group(self, name, machine):
+        """Add a machine to a named group.
+
+        Arguments:
+            name: the group's name string
+            machine: the StateMachine to add
+        """
+        self.groups.setdefault(name, {})[machine.handle] = machine
+        self.group_keys.setdefault(machine.handle, set()).add(name)
+
+    def leave_group(self, name, machine):
+        """Remove a machine from a named group.
+
+        Arguments:
+            name: the group's name string
+            machine: the StateMachine to remove
+        """
+        try:
+            members = self.groups[name]
+            del members[machine.handle]
+        except KeyError:
+            return
+
+        if not members:
+            del self.groups[name]
+
+        self.group_keys[machine.handle].discard(name)
+
+    def leave_groups(self, machine):
+        """Remove a machine from all groups.
+
+        Arguments:
+            machine: the halted StateMachine
+        """
+        handle = machine.handle
+
+        for name in self.group_keys.pop(handle, ()):
+            members = self.groups[name]
+            del members[handle]
+
+            if not members:
+                del self.groups[name]
+
+    def group(self, name):
+        """Return the members of a named group, in the order they joined.
+
+        Arguments:
+            name: the group's name string
+        """
+        return tuple(self.groups.get(name, {}).values())
+
+    def purge_reactions(self, machine):
+        """Remove all reactions of a machine.
+
+        Arguments:
+            machine: the halted StateMachine
+        """
+        handle = machine.handle
+
+        for typ in self.event_keys.pop(handle, ()):
+            reactions = self.event_reactions[typ]
+            del reactions[handle]
+
+            if not reactions:
+                del self.event_reactions[typ]
+
+        for index in self.machine_keys.pop(handle, ()):
+            reactions = self.machine_reactions[index]
+            del reactions[handle]
+
+            if not reactions:
+                del self.machine_reactions[index]
+                self.emitter_keys[index[1]].discard(index[0])
+
+    def purge_emitter_reactions(self, machine):
+        """Remove all reactions to a machine's events.
+
+        Arguments:
+            machine: the halted StateMachine, with no events left
+        """
+        handle = machine.handle
+
+        for typ in self.emitter_keys.pop(handle, ()):
+            index = (typ, handle)
+
+            for reactor in self.machine_reactions.pop(index):
+                self.machine_keys[reactor].discard(index)
+
+    def release(self, event):
+        """Account for an event copy leaving the event buss or an inbox.
+
+        Once a halted machine has no events left, reactions to its events are
+        removed.
+
+        Arguments:
+            event: the Event that has been consumed or discarded
+        """
+        emitter = event.emitter
+        emitter.in_flight -= 1
+
+        if emitter.in_flight == 0 and self.is_halted(emitter):
+            self.purge_emitter_reactions(emitter)
+
+    def is_halted(self, machine):
+        """Return whether a machine has halted.
+
+        The context of the first machine never halts, as it emits injected
+        events.
+
+        Arguments:
+            machine: the StateMachine to check
+        """
+        return machine is not self.ctx and machine not in self.machines
+
+    def suspend(self, machine):
+        """Suspend a machine until an event is delivered to it.
+
+        Arguments:
+            machine: the StateMachine with an empty inbox
+        """
+        machine.is_suspended = True
+        self.awake.discard(machine)
+
+    def wake(self, machine):
+        """Take a machine out of suspension.
+
+        When using a ready queue, the machine is enqueued again.
+
+        Arguments:
+            machine: the StateMachine an event was delivered to
+        """
+        if not machine.is_suspended:
+            return
+
+        machine.is_suspended = False
+        self.awake.add(machine)
+
+        if self.ready_queue:
+            self.ready.append(machine)
 
     def emit(self, event):
         """Add an event to the event buss.
@@ -159,9 +558,23 @@ class MachineControl:
         Arguments:
             event: the to be emitted Event
         """
+        self.stamp(event)
+        self.event_buss.append(event)
+
+    def stamp(self, event):
+        """Number an emitted event and account for it.
+
+        Arguments:
+            event: the emitted Event
+        """
         self.event_n += 1
         event.n = self.event_n
 
+        event.emitter.in_flight += 1
+
+        if self.tracer is not None:
+            self.tracer.emit(event)
+
         if self.debug:
             try:
                 self.debug_windows[event.emitter].write(
@@ -171,253 +584,1161 @@ class MachineControl:
                 # no debug window is created.
                 ...
 
-        self.event_buss.append(event)
+    def ack_type(self, typ):
+        """Return the type of acknowledgements of events of a type.
 
-    def run(self, machine_cls, *args, **kwargs):
-        """Start a state machine and cycle until all machines have halted.
+        Acknowledgement types are interned, so they are only created once.
 
-        A context is created for this first machine, by instantiating the
-        StateMachine superclass without a context.
+        Arguments:
+            typ: the acknowledged event's type string
+        """
+        try:
+            return self.ack_types[typ]
+        except KeyError:
+            ack_typ = self.ack_types[typ] = sys.intern(typ + '_ack')
+            return ack_typ
+
+    def acknowledge(self, event, machine):
+        """Acknowledge an event to its emitter.
+
+        The acknowledgement is delivered directly, without going through the
+        event buss. Its value is that of the acknowledged event.
+
+        Of a multicast event, only the last acknowledgement is delivered.
 
         Arguments:
-            machine_cls: a StateMachine subclass
-            \*args/\*\*kwargs: any arguments the state machine takes
+            event: the acknowledged Event
+            machine: the StateMachine acknowledging the event
         """
-        self.ctx = StateMachine(self, None)
-        self.start_machine(machine_cls, self.ctx, *args, **kwargs)
+        if self.pending_acks:
+            self.settle_ack(machine.handle, event.emitter.handle, event.n)
 
-        while self.cycle():
-            ...
+        if self.multicast_acks and not self.count_ack(event.emitter.handle,
+                                                      event.n):
+            return
 
-        self.reset()
+        ack = Event(self.ack_type(event.typ), machine, value=event.value,
+                    destination=event.emitter)
+        ack.acked = event.n
 
-    def cycle(self):
-        """Distribute events, cycle a machine and return whether any are left.
+        self.stamp(ack)
+        self.deliver(ack)
 
-        When the machine queue is empty, False is returned. Otherwise, True is
-        returned.
+    def count_ack(self, emitter, n):
+        """Count an acknowledgement, and return whether to deliver it.
 
-        If debuggin is on, the cycles machine's state before and after the
-        cycle is shown in the machine's debuggin window, accompanied by any
-        variables indicated in the machine. If these variables have changed
-        after the cycle, the changed values are shown as well.
+        Acknowledgements of a multicast event are only delivered once all of
+        its recipients have acknowledged it. Any other acknowledgement is
+        always delivered.
+
+        Arguments:
+            emitter: the handle of the acknowledged event's emitter
+            n: the number of the acknowledged event
         """
-        while self.distribute_events():
-            pass
+        key = (emitter, n)
 
         try:
-            machine = self.machines.popleft()
-        except IndexError:
-            return False
+            remaining = self.multicast_acks[key] - 1
+        except KeyError:
+            return True
 
-        self.machines.append(machine)
+        if remaining > 0:
+            self.multicast_acks[key] = remaining
+            return False
 
-        if machine.is_suspended:
-            return True
+        del self.multicast_acks[key]
+        return True
 
-        c_state = machine.current_state
+    def await_ack(self, event, machine):
+        """Record that a machine received an event it should acknowledge.
 
-        if self.debug:
-            var_str = self.debug_precycle(machine)
+        Only events of live machines of this machine control are recorded, as
+        only these machines wait for acknowledgements here. If the machine
+        halts before acknowledging the event, the acknowledgement is given up
+        on, see `abandon_acks`.
 
-        machine.cycle()
+        Arguments:
+            event: the Event requiring acknowledgement
+            machine: the event's receiving StateMachine
+        """
+        if event.emitter in self.machines:
+            self.pending_acks.setdefault(machine.handle, {})[
+                event.emitter.handle, event.n] = event
 
-        n_state = machine.current_state
+    def settle_ack(self, handle, emitter, n):
+        """Stop tracking an acknowledgement once it is sent.
 
-        if self.debug:
-            self.debug_aftercycle(machine, c_state, n_state, var_str)
+        Arguments:
+            handle: the handle of the acknowledging machine
+            emitter: the handle of the acknowledged event's emitter
+            n: the number of the acknowledged event
+        """
+        pending = self.pending_acks.get(handle)
 
-        if self.step:
-            input('Press enter to step...')
+        if pending is not None:
+            pending.pop((emitter, n), None)
 
-        return True
+            if not pending:
+                del self.pending_acks[handle]
 
-    def distribute_events(self):
-        """Distribute an event to machines and return whether any are left.
+    def abandon_acks(self, machine):
+        """Give up on the acknowledgements a halted machine still owes.
 
-        If an event has a destination and that destination is still alive (i.e.
-        not halted), the event is put into that machine's inbox.  Otherwise,
-        the event is put into the inbox of all live machines, except the
-        event's emitter.
+        The emitter of an event sent to the machine alone stops waiting for
+        its acknowledgement. Of a multicast event, the machine no longer holds
+        up the completion, and counts as having acknowledged it.
 
-        If an event has been distributed, True is returned. Otherwise, False is
-        returned.
+        Arguments:
+            machine: the halted StateMachine
         """
-        try:
-            event = self.event_buss.popleft()
-        except IndexError:
-            return False
+        for event in self.pending_acks.pop(machine.handle, {}).values():
+            if event.destination.__class__ is tuple:
+                self.acknowledge(event, machine)
+            else:
+                event.emitter.acks.pop(event.n, None)
 
-        # An event is being distributed.
+    def now(self):
+        """Return the current time in seconds, according to the clock used."""
+        if self.virtual_time:
+            return self.virtual_now
 
-        if event.destination is not None:
-            if event.destination in self.machines:
-                event.destination.inbox.append(event)
+        return time.monotonic()
 
-            event.destination.is_suspended = False
+    def add_timer(self, machine, delay, typ, value=None):
+        """Add a timer for a machine and return it.
 
-            return True
+        After the delay, an event is emitted by the machine to itself.
 
-        for machine in self.machines:
-            if machine == event.emitter:
-                continue
-            machine.inbox.append(event)
+        Arguments:
+            machine: the StateMachine setting the timer
+            delay: the delay in seconds
+            typ: the timer event's type string
 
-            # Take all machines out of suspension.
-            machine.is_suspended = False
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+        """
+        self.timer_n += 1
 
-        return True
+        timer = [self.now() + delay, self.timer_n,
+                 Event(typ, machine, value=value, destination=machine)]
+        heapq.heappush(self.timers, timer)
 
-    def filter_event(self, machine, event):
-        """Returns a state if a machine should react to an event.
+        self.machine_timers.setdefault(machine.handle, {})[self.timer_n] = (
+            timer)
 
-        If a reaction exists, the machine's reaction state is returned.
-        Otherwise, None is returned.
+        return timer
 
-        First machine reactions is checked, because such reactions are more
-        specific and thus have priority.
+    def cancel_timer(self, timer):
+        """Cancel a timer, if it has not gone off yet.
+
+        The timer stays in the heap, but its event is not emitted.
 
         Arguments:
-            machine: the reacting state machine, a StateMachine
-            event: the event to be checked, an Event
+            timer: a timer, as returned by `add_timer`
         """
-        index = (event.typ, event.emitter)
-        if index in self.machine_reactions:
-            try:
-                return self.machine_reactions[index][machine]
-            except KeyError:
-                pass
-
-        if event.typ in self.event_reactions:
-            try:
-                return self.event_reactions[event.typ][machine]
-            except KeyError:
-                pass
+        event = timer[2]
 
-        return None
+        if event is not None:
+            timer[2] = None
+            self.forget_timer(event.emitter.handle, timer[1])
 
-    def halt(self, machine):
-        """Halt a machine.
+    def forget_timer(self, handle, key):
+        """Stop tracking a timer that went off or was cancelled.
 
-        If debuggin is on, the machine's debuggin window's title is altered to
-        include \`HALTED' and the window's stdin pipe is closed.
+        Arguments:
+            handle: the handle of the machine that set the timer
+            key: the timer's key among the machine's timers
         """
-        if self.debug:
-            debug_window = self.debug_windows[machine]
-            debug_window.set_title('HALTED %s' % (type(machine).__name__))
-            debug_window.close()
+        timers = self.machine_timers.get(handle)
 
-        self.machines.remove(machine)
+        if timers is not None:
+            timers.pop(key, None)
 
-    def reset(self):
-        """Reset machine control.
+            if not timers:
+                del self.machine_timers[handle]
 
-        This prepares it for a next run. Python garbage collects itself, but in
-        an actual implementation, all these fields need to be emptied
-        carefully.
+    def cancel_timers(self, machine):
+        """Cancel all timers of a halted machine.
+
+        Arguments:
+            machine: the halted StateMachine
         """
-        self.machines.clear()
+        for timer in self.machine_timers.pop(machine.handle, {}).values():
+            self.cancel_timer(timer)
 
-        self.event_reactions = {}
-        self.machine_reactions = {}
+    def fire_timers(self):
+        """Emit the events of all timers whose deadline has passed."""
+        now = self.now()
 
-        self.event_buss.clear()
+        while self.timers and self.timers[0][0] <= now:
+            _, key, event = heapq.heappop(self.timers)
 
-        self.ctx = None
+            if event is not None:
+                self.forget_timer(event.emitter.handle, key)
+                self.emit(event)
 
-        self.react_event = None
-        self.event_n = 0
+    def wait_for_timer(self):
+        """Wait until the earliest timer's deadline.
 
-        if self.debug:
-            self.debug_windows = {}
+        Injected events end the wait early. With a virtual clock, the clock is
+        set to the deadline instead.
+        """
+        while self.timers and self.timers[0][2] is None:
+            heapq.heappop(self.timers)
 
-    def debug_precycle(self, machine):
-        """Send info to a machine's debug window before a cycle.
+        if not self.timers:
+            return
 
-        First the machine's current state is show. After this, if the machine
-        has indicitated any variables as information, these are shown as well.
+        deadline = self.timers[0][0]
 
-        Arguments:
-            machine: the StateMachine to show debug information for
-        """
-        debug_window = self.debug_windows[machine]
-        debug_window.write('State: %s' % (machine.current_state.__name__))
+        if self.virtual_time:
+            self.virtual_now = max(self.virtual_now, deadline)
+        else:
+            self.input_ready.clear()
 
-        var_str = machine.var_str()
-        if var_str != '':
-            debug_window.write('Vars: %s' % (var_str))
+            if not self.inputs:
+                self.input_ready.wait(max(0, deadline - time.monotonic()))
+
+    def inject(self, typ, value=None, destination=None):
+        """Emit an event from outside the program.
+
+        This may be called from any thread. The event is emitted by the
+        context of the first machine, before the next cycle.
+
+        Arguments:
+            typ: the event's type string
+
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+            destination: the StateMachine the event should end up with \
+                (default None)
+        """
+        self.inputs.append((typ, value, destination))
+        self.input_ready.set()
+
+    def read_inputs(self):
+        """Emit all injected events."""
+        while self.inputs:
+            typ, value, destination = self.inputs.popleft()
+            self.emit(Event(typ, self.ctx, value=value,
+                            destination=destination))
+
+    def quiesce(self):
+        """Handle a program in which no machine can run by itself anymore.
+
+        Either waits for injected events and returns True, or returns False to
+        stop the program.
+        """
+        if not self.wait_for_input:
+            return False
+
+        self.input_ready.clear()
+
+        if not self.inputs:
+            self.input_ready.wait()
+
+        return True
+
+    def deadlock_report(self):
+        """Return a report of all machines that are stuck.
+
+        For each machine, its state and reactions are listed.
+        """
+        lines = ['Deadlock: %d machine(s) are suspended, and no events or '
+                 'timers are left.' % (len(self.machines))]
+
+        for machine in self.machines:
+            lines.append('%s (handle %d) in state %s' % (
+                machine, machine.handle, machine.current_state.__name__))
+
+            for typ in sorted(self.event_keys.get(machine.handle, ())):
+                state = self.event_reactions[typ][machine.handle]
+                lines.append('    when %r -> %s' % (typ, state.__name__))
+
+            for index in sorted(self.machine_keys.get(machine.handle, ())):
+                typ, emitter = index
+                state = self.machine_reactions[index][machine.handle]
+
+                lines.append('    when %s emits %r -> %s' % (
+                    self.describe(emitter), typ, state.__name__))
+
+            for n, (typ, emitter, state) in sorted(machine.acks.items()):
+                if emitter is None:
+                    lines.append('    when all recipients emit %r for event '
+                                 '%d -> %s' % (typ, n, state.__name__))
+                else:
+                    lines.append('    when %s emits %r for event %d -> %s' % (
+                        self.describe(emitter), typ, n, state.__name__))
+
+        return '\n'.join(lines) + '\n'
+
+    def describe(self, handle):
+        """Return a description of a machine, for diagnostics.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        if handle == self.ctx.handle:
+            return 'context'
+
+        machine = self.machines.get(handle)
+        if machine is None:
+            return 'halted machine %d' % (handle)
+
+        return str(machine)
+
+    def run(self, machine_cls, *args, **kwargs):
+        """Start a state machine and cycle until all machines have halted.
+
+        A context is created for this first machine, by instantiating the
+        StateMachine superclass without a context.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            \*args/\*\*kwargs: any arguments the state machine takes
+        """
+        if self.trace is not None:
+            self.tracer = TraceWriter(self.trace)
+
+        self.ctx = StateMachine(self, None)
+        self.ctx.handle = self.machines.new_handle()
+
+        try:
+            self.start_machine(machine_cls, self.ctx, *args, **kwargs)
+
+            while self.cycle():
+                ...
+        finally:
+            if self.tracer is not None:
+                self.tracer.close()
+                self.tracer = None
+
+        if len(self.machines) > 0:
+            sys.stderr.write(self.deadlock_report())
+
+        if self.profiler is not None:
+            sys.stderr.write(self.profiler.report())
+
+        self.reset()
+
+    def stats(self):
+        """Return profiling statistics per machine class, or None.
+
+        Statistics are only collected if profiling is turned on. They
+        accumulate over runs. See Profiler.stats for their layout.
+        """
+        if self.profiler is None:
+            return None
+
+        return self.profiler.stats()
+
+    def cycle(self):
+        """Distribute events, cycle a machine and return whether any are left.
+
+        When the machine queue is empty, False is returned. Otherwise, True is
+        returned. With a ready queue, the first runnable machine is cycled and
+        only enqueued again if it has not suspended or halted.
+
+        If debuggin is on, the cycles machine's state before and after the
+        cycle is shown in the machine's debuggin window, accompanied by any
+        variables indicated in the machine. If these variables have changed
+        after the cycle, the changed values are shown as well.
+
+        Injected events are emitted first. Then, if there are timers, due ones
+        go off. If every machine is suspended and no events are left, the next
+        deadline is awaited. Without any timers, the program is stuck, which is
+        detected without looking at the machines themselves.
+        """
+        if self.inputs:
+            self.read_inputs()
+
+        if self.timers:
+            if not self.awake and not self.event_buss:
+                self.wait_for_timer()
+
+            self.fire_timers()
+
+        while self.distribute_events():
+            pass
+
+        if not self.awake and not self.timers and len(self.machines) > 0:
+            return self.quiesce()
+
+        if self.ready_queue:
+            try:
+                machine = self.ready.popleft()
+            except IndexError:
+                return len(self.machines) > 0
+        else:
+            try:
+                machine = self.rotation.popleft()
+            except IndexError:
+                return False
+
+            if machine.is_suspended:
+                self.rotation.append(machine)
+                return True
+
+            # Halted machines are removed from the rotation lazily. They are
+            # never suspended.
+            if self.machines.get(machine.handle) is not machine:
+                return True
+
+            self.rotation.append(machine)
+
+        if self.debug:
+            c_state = machine.current_state
+            var_str = self.debug_precycle(machine)
+
+        machine.cycle()
+
+        if self.debug:
+            self.debug_aftercycle(machine, c_state, machine.current_state,
+                                  var_str)
+
+        if self.quantum > 1:
+            self.continue_turn(machine)
+
+        if (self.ready_queue and not machine.is_suspended
+                and machine in self.machines):
+            self.ready.append(machine)
+
+        if self.step:
+            input('Press enter to step...')
+
+        return True
+
+    def continue_turn(self, machine):
+        """Keep cycling a machine until its turn is over.
+
+        The turn is over once the machine is about to listen or halt, or it
+        has run as many states as the quantum allows. Events emitted by a
+        state are distributed before the next state runs, as they would be in
+        between turns.
+
+        Arguments:
+            machine: the StateMachine that has just cycled once
+        """
+        for _ in range(self.quantum - 1):
+            if machine.ends_turn():
+                return
+
+            while self.distribute_events():
+                pass
+
+            if self.debug:
+                c_state = machine.current_state
+                var_str = self.debug_precycle(machine)
+
+            machine.cycle()
+
+            if self.debug:
+                self.debug_aftercycle(machine, c_state,
+                                      machine.current_state, var_str)
+
+    def distribute_events(self):
+        """Distribute an event to machines and return whether any are left.
+
+        If an event has a destination and that destination is still alive (i.e.
+        not halted), the event is put into that machine's inbox.  Otherwise,
+        the event is put into the inbox of all awake machines and of all
+        suspended machines with a matching reaction, except the event's
+        emitter.
+
+        Leaving out suspended machines without a matching reaction does not
+        change their behaviour. A suspended machine has an empty inbox and
+        cannot alter its reactions before reading the event, so it would have
+        discarded the event anyway.
+
+        If an event has been distributed, True is returned. Otherwise, False is
+        returned.
+        """
+        try:
+            event = self.event_buss.popleft()
+        except IndexError:
+            return False
+
+        self.deliver(event)
+
+        return True
+
+    def deliver(self, event):
+        """Deliver an event from the event buss to the machines' inboxes.
+
+        Arguments:
+            event: the Event to deliver
+        """
+        if event.destination is not None:
+            if event.destination.__class__ is tuple:
+                self.deliver_many(event)
+            elif event.destination in self.machines:
+                event.destination.inbox.append(event)
+                self.wake(event.destination)
+
+                if event.ack:
+                    self.await_ack(event, event.destination)
+            else:
+                if event.ack and event.emitter in self.machines:
+                    event.emitter.acks.pop(event.n, None)
+
+                self.release(event)
+
+            return
+
+        emitter = event.emitter
+
+        for machine in self.awake:
+            if machine is not emitter:
+                machine.inbox.append(event)
+                emitter.in_flight += 1
+
+        self.deliver_subscribed(
+            event, self.machine_reactions.get((event.typ, emitter.handle), ()))
+        self.deliver_subscribed(
+            event, self.event_reactions.get(event.typ, ()))
+
+        self.release(event)
+
+    def deliver_many(self, event):
+        """Deliver a multicast event to each of its live destinations.
+
+        Every destination's inbox gets the same Event object. If the event
+        requires acknowledgement, the number of recipients is kept, to
+        aggregate their acknowledgements. Without any recipients, the emitter
+        gets the completion right away.
+
+        Arguments:
+            event: the Event, with a tuple of destinations
+        """
+        recipients = 0
+
+        for machine in event.destination:
+            if self.deliver_one(event, machine):
+                recipients += 1
+
+        if event.ack:
+            if recipients > 0:
+                self.multicast_acks[event.emitter.handle, event.n] = (
+                    recipients)
+            else:
+                self.acknowledge(event, event.emitter)
+
+        self.release(event)
+
+    def deliver_one(self, event, machine):
+        """Deliver a multicast event to one machine, if it is alive.
+
+        Returns whether the event was delivered.
+
+        Arguments:
+            event: the multicast Event
+            machine: one of the event's destinations
+        """
+        if machine not in self.machines:
+            return False
+
+        machine.inbox.append(event)
+        event.emitter.in_flight += 1
+        self.wake(machine)
+
+        if event.ack:
+            self.await_ack(event, machine)
+
+        return True
+
+    def deliver_subscribed(self, event, reactors):
+        """Deliver a broadcast event to suspended machines reacting to it.
+
+        Awake machines are skipped, because they have already received the
+        event.
+
+        Arguments:
+            event: the broadcast Event
+            reactors: the handles of the machines with a reaction to the event
+        """
+        for handle in reactors:
+            machine = self.machines.get(handle)
+
+            if (machine is not None and machine.is_suspended
+                    and machine is not event.emitter):
+                machine.inbox.append(event)
+                event.emitter.in_flight += 1
+                self.wake(machine)
+
+    def filter_event(self, machine, event):
+        """Returns a state if a machine should react to an event.
+
+        If a reaction exists, the machine's reaction state is returned.
+        Otherwise, None is returned.
+
+        First machine reactions is checked, because such reactions are more
+        specific and thus have priority.
+
+        Arguments:
+            machine: the reacting state machine, a StateMachine
+            event: the event to be checked, an Event
+
+        An acknowledgement the machine awaits takes precedence over any
+        reaction.
+        """
+        if event.acked is not None and machine.acks:
+            pending = machine.acks.pop(event.acked, None)
+            if pending is not None:
+                return pending[2]
+
+        index = (event.typ, event.emitter.handle)
+        if index in self.machine_reactions:
+            try:
+                return self.machine_reactions[index][machine.handle]
+            except KeyError:
+                pass
+
+        if event.typ in self.event_reactions:
+            try:
+                return self.event_reactions[event.typ][machine.handle]
+            except KeyError:
+                pass
+
+        return None
+
+    def halt(self, machine):
+        """Halt a machine, and with it the suspended part of its subtree.
+
+        A suspended child with its default reaction to the machine's \`halt'
+        event would wake up, read the event and halt. Instead, it emits its
+        own \`halt' event and is halted right away, which goes for its own
+        children as well. Machines are halted breadth first, the order in
+        which they would have emitted their \`halt' events.
+
+        Arguments:
+            machine: the StateMachine that has emitted \`halt'
+        """
+        halting = queue([machine])
+
+        while halting:
+            machine = halting.popleft()
+            self.remove_machine(machine)
+
+            for child in self.children.pop(machine.handle, {}).values():
+                if child.is_suspended and self.halts_with(child, machine):
+                    child.current_state = child.halt
+                    child.emit('halt')
+                    halting.append(child)
+
+    def halts_with(self, machine, ctx):
+        """Return whether a machine halts on its context's \`halt' event.
+
+        Arguments:
+            machine: the StateMachine
+            ctx: the machine's context
+        """
+        reaction = self.machine_reactions.get(('halt', ctx.handle), {}).get(
+            machine.handle)
+
+        return getattr(reaction, '__func__', reaction) is StateMachine.halt
+
+    def remove_machine(self, machine):
+        """Remove a halted machine.
+
+        The machine's inbox is emptied and its reactions and timers are
+        removed, as well as reactions to its events if none of them are left.
+        Acknowledgements it still owes are given up on. A halted machine is
+        never suspended, so the rotation drops it.
+
+        If debuggin is on, the machine's debuggin window's title is altered to
+        include \`HALTED' and the window's stdin pipe is closed.
+
+        Arguments:
+            machine: the halted StateMachine
+        """
+        if self.pending_acks:
+            self.abandon_acks(machine)
+
+        if self.debug:
+            debug_window = self.debug_windows[machine]
+            debug_window.set_title('HALTED %s' % (type(machine).__name__))
+            debug_window.close()
+
+        self.machines.remove(machine)
+        self.awake.discard(machine)
+        machine.is_suspended = False
+
+        siblings = self.children.get(machine.ctx.handle)
+        if siblings is not None:
+            del siblings[machine.handle]
+
+            if not siblings:
+                del self.children[machine.ctx.handle]
+
+        if self.profiler is not None:
+            self.profiler.forget(machine)
+
+        for event in machine.inbox.drain():
+            self.release(event)
+
+        self.purge_reactions(machine)
+        self.leave_groups(machine)
+        self.cancel_timers(machine)
+
+        if machine.in_flight == 0:
+            self.purge_emitter_reactions(machine)
+
+    def reset(self):
+        """Reset machine control.
+
+        This prepares it for a next run. Python garbage collects itself, but in
+        an actual implementation, all these fields need to be emptied
+        carefully.
+        """
+        self.machines.clear()
+        self.rotation.clear()
+        self.ready.clear()
+        self.awake.clear()
+
+        self.event_reactions = {}
+        self.machine_reactions = {}
+
+        self.event_keys = {}
+        self.machine_keys = {}
+        self.emitter_keys = {}
+
+        self.event_buss.clear()
+
+        self.children = {}
+
+        self.multicast_acks = {}
+        self.pending_acks = {}
+
+        self.groups = {}
+        self.group_keys = {}
+
+        self.timers = []
+        self.machine_timers = {}
+        self.virtual_now = 0.0
+
+        self.inputs.clear()
+        self.input_ready.clear()
+
+        self.ctx = None
+
+        self.react_event = None
+        self.event_n = 0
+
+        if self.debug:
+            self.debug_windows = {}
+
+    def debug_precycle(self, machine):
+        """Send info to a machine's debug window before a cycle.
+
+        First the machine's current state is show. After this, if the machine
+        has indicitated any variables as information, these are shown as well.
+
+        Arguments:
+            machine: the StateMachine to show debug information for
+        """
+        debug_window = self.debug_windows[machine]
+        debug_window.write('State: %s' % (machine.current_state.__name__))
+
+        var_str = machine.var_str()
+        if var_str != '':
+            debug_window.write('Vars: %s' % (var_str))
+
+        return var_str
+
+    def debug_aftercycle(self, machine, p_state, n_state, p_var_str):
+        """Send info to a machine's debug window after a cycle.
+
+        First the machine's variables are compared to its variables before the
+        cycle. If they are changed, they are displayed. If the machine was in
+        its listen state and reacted to an event, this event is displayed.
+        Finally, if the cycle resulted in a state transition, the new state is
+        displayed.
+
+        If the machine cycled its halt state, nothing is to be done.
+
+        Arguments:
+            machine: the StateMachine to show debug information for
+            p_state: the machine's state before the cycle
+            n_state: the machine's state after the cycle
+            p_var_str: the machine's variable string before the cycle
+        """
+        if p_state.__name__ == 'halt':
+            return
+
+        debug_window = self.debug_windows[machine]
+
+        var_str = machine.var_str()
+        if var_str != '' and var_str != p_var_str:
+            if p_var_str == '':
+                s = 'Vars'
+            else:
+                s = '  '
+            debug_window.write('%s -> %s' % (s, var_str))
+
+        if p_state.__name__ == 'listen' and self.react_event is not None:
+            debug_window.write(str(self.react_event))
+
+        if n_state is not None:
+            debug_window.write('=> %s' % (n_state.__name__))
+
+        debug_window.write('')
+
+
+SCALAR_TYPES = frozenset((bool, int, float, complex, str, bytes, type(None)))
+
+
+def is_immutable(value):
+    """Return whether a value is an immutable scalar, or a tuple or frozenset
+    of immutable values.
+
+    Arguments:
+        value: the value
+    """
+    if type(value) in SCALAR_TYPES:
+        return True
+
+    if type(value) in (tuple, frozenset):
+        return all(map(is_immutable, value))
+
+    return False
+
+
+def can_snapshot(value):
+    """Return whether changes to a value can be detected with a snapshot.
+
+    This is the case for immutable values, and for lists, dictionaries and
+    sets of immutable values. Changes to any other value, like an object or a
+    nested list, would go unnoticed.
+
+    Arguments:
+        value: the value
+    """
+    if type(value) in (list, set):
+        return all(map(is_immutable, value))
+
+    if type(value) is dict:
+        return (all(map(is_immutable, value))
+                and all(map(is_immutable, value.values())))
+
+    return is_immutable(value)
+
+
+def snapshot_value(value):
+    """Return a snapshot of a value to detect changes with.
+
+    Of lists and sets, a list of their items is taken, and of dictionaries, a
+    list of their keys and one of their values. Other values are their own
+    snapshot. See `can_snapshot` for the values this works for.
+
+    Arguments:
+        value: the value
+    """
+    if type(value) in (list, set):
+        return list(value)
+
+    if type(value) is dict:
+        return list(value), list(value.values())
+
+    return value
+
+
+def is_unchanged(snapshot, value):
+    """Return whether a value is the same as when its snapshot was taken.
+
+    Immutable values are compared by identity, rather than equality, as equal
+    values of different types, like 1 and 1.0, are formatted differently.
+
+    Arguments:
+        snapshot: the snapshot, of a value of the same type
+        value: the value
+    """
+    if type(value) in (list, set):
+        return len(snapshot) == len(value) and all(map(is_, snapshot, value))
+
+    if type(value) is dict:
+        keys, values = snapshot
+        return (len(keys) == len(value) and all(map(is_, keys, value))
+                and all(map(is_, values, value.values())))
+
+    return snapshot is value
+
+
+def check_registered(machine):
+    """Raise a RuntimeError if a machine has no handle yet.
+
+    Reactions are stored by handle, which a machine only gets when it is
+    registered after `__init__`. Reactions should be added in a state instead.
+
+    Arguments:
+        machine: a StateMachine
+    """
+    if machine.handle is None:
+        raise RuntimeError('%s is not registered yet, add reactions in its '
+                           'initial state rather than in __init__'
+                           % (type(machine).__name__))
+
+
+class MachineRegistry:
+    """Keep track of live state machines by integer handle.
+
+    Every machine gets a handle when it is registered, which stays the same for
+    the machine's lifetime and is never reused. Checking whether a machine is
+    alive and removing it take constant time, and iterating yields the
+    machines in the order they were started.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.machines = {}
+        self.next_handle = 0
+
+    def new_handle(self):
+        """Return a new handle, without registering any machine."""
+        handle = self.next_handle
+        self.next_handle += 1
+
+        return handle
+
+    def add(self, machine, handle=None):
+        """Register a machine and return its handle.
+
+        Arguments:
+            machine: the StateMachine to register
+
+        Keyword arguments:
+            handle: the handle to use, which should not be in use (default a \
+                new handle)
+        """
+        if handle is None:
+            handle = self.new_handle()
+
+        machine.handle = handle
+        self.machines[machine.handle] = machine
+
+        return machine.handle
+
+    def remove(self, machine):
+        """Remove a registered machine.
+
+        Arguments:
+            machine: the StateMachine to remove
+        """
+        del self.machines[machine.handle]
+
+    def get(self, handle):
+        """Return the live machine with a handle, or None if there is none.
+
+        Arguments:
+            handle: the machine's handle
+        """
+        return self.machines.get(handle)
+
+    def clear(self):
+        """Remove all machines. Handles are not reused afterwards."""
+        self.machines.clear()
+
+    def __contains__(self, machine):
+        return self.machines.get(machine.handle) is machine
+
+    def __iter__(self):
+        return iter(self.machines.values())
+
+    def __len__(self):
+        return len(self.machines)
+
+
+class Event:
+    """An event for interaction between state machines.
+
+    Events are created for every emit and acknowledgement, so they have fixed
+    attributes and no instance dictionary.
+    """
+
+    __slots__ = ('typ', 'value', 'emitter', 'destination', 'ack', 'n',
+                 'acked')
+
+    def __init__(self, typ, emitter, value=None, destination=None, ack=False):
+        """Initialize the event.
+
+        Arguments:
+            typ: the event's type string
+            emitter: the StateMachine emitting the event
+
+        Keyword arguments:
+            value: value to transmit (default None)
+            destination: the StateMachine the event should end up with, or a \
+                tuple of them (default None)
+            ack: whether the receiving machine should emit an acknowledgement \
+                (default False)
+        """
+        self.typ = typ
+        self.value = value
+        self.emitter = emitter
+        self.destination = destination
+        self.ack = ack
+
+        self.n = -1
+        self.acked = None
+
+    def __repr__(self):
+        return '<Ev(%d):typ=%s,emitter=%s,destination=%s,ack=%s>' % (
+            self.n, self.typ, self.emitter, self.destination, self.ack)
+
+
+class Inbox:
+    """Queue the events delivered to a machine, in order of arrival.
+
+    Ignoring the events of a type, optionally from one emitter, takes constant
+    time. Rather than searching the queue, this is recorded as a rule, marking
+    all such events queued at the time as dead. Events arriving later are not
+    affected. Dead events are released and skipped once they reach the front
+    of the queue.
+
+    While rules are kept, events are numbered by arrival. As the queue is
+    first in, first out, an event's number follows from the number of events
+    taken out before it, so it is not stored. Once every event a rule could
+    apply to is taken out, the rules are forgotten.
+
+    The events are kept in a deque. `append` and `popleft` are attributes,
+    which are the deque's own methods while there are no rules. Otherwise
+    `popleft` is `take`. The length of the inbox includes dead events not yet
+    skipped.
+    """
+
+    __slots__ = ('events', 'ctl', 'append', 'popleft', 'rules', 'taken',
+                 'horizon')
+
+    def __init__(self, ctl):
+        """Initialize an empty inbox.
+
+        Arguments:
+            ctl: the MachineControl instance releasing dead events
+        """
+        self.events = queue()
+        self.ctl = ctl
+
+        self.append = self.events.append
+        self.popleft = self.events.popleft
+
+        self.rules = None
+        self.taken = 0
+        self.horizon = 0
+
+    def ignore(self, typ, emitter=None):
+        """Mark the queued events of a type as dead.
+
+        Arguments:
+            typ: the event's type string
+
+        Keyword arguments:
+            emitter: the handle of the events' emitter, or None for any \
+                emitter (default None)
+        """
+        if not self.events:
+            return
+
+        if self.rules is None:
+            self.rules = {}
+            self.taken = 0
+            self.popleft = self.take
+
+        self.horizon = self.taken + len(self.events)
+        self.rules.setdefault(typ, {})[emitter] = self.horizon
+
+    def is_dead(self, event, n):
+        """Return whether an event is marked as dead.
+
+        Arguments:
+            event: the Event
+            n: the event's number
+        """
+        rules = self.rules.get(event.typ)
+        if rules is None:
+            return False
+
+        return (rules.get(event.emitter.handle, 0) >= n
+                or rules.get(None, 0) >= n)
+
+    def take(self):
+        """Take the first live event out of the inbox and return it.
+
+        Dead events before it are released. Raises IndexError if there is no
+        live event.
+        """
+        events = self.events
 
-        return var_str
+        while self.rules is not None:
+            event = events.popleft()
+            self.taken += 1
+            dead = self.is_dead(event, self.taken)
 
-    def debug_aftercycle(self, machine, p_state, n_state, p_var_str):
-        """Send info to a machine's debug window after a cycle.
+            if self.taken >= self.horizon:
+                self.rules = None
+                self.popleft = events.popleft
 
-        First the machine's variables are compared to its variables before the
-        cycle. If they are changed, they are displayed. If the machine was in
-        its listen state and reacted to an event, this event is displayed.
-        Finally, if the cycle resulted in a state transition, the new state is
-        displayed.
+            if not dead:
+                return event
 
-        If the machine cycled its halt state, nothing is to be done.
+            self.ctl.release(event)
 
-        Arguments:
-            machine: the StateMachine to show debug information for
-            p_state: the machine's state before the cycle
-            n_state: the machine's state after the cycle
-            p_var_str: the machine's variable string before the cycle
+        return events.popleft()
+
+    def drain(self):
+        """Take all live events out of the inbox and return them as a list.
+
+        Dead events are released.
         """
-        if p_state.__name__ == 'halt':
-            return
+        if self.rules is None:
+            events = list(self.events)
+            self.events.clear()
+            return events
 
-        debug_window = self.debug_windows[machine]
+        events = []
 
-        var_str = machine.var_str()
-        if var_str != '' and var_str != p_var_str:
-            if p_var_str == '':
-                s = 'Vars'
-            else:
-                s = '  '
-            debug_window.write('%s -> %s' % (s, var_str))
+        while True:
+            try:
+                events.append(self.take())
+            except IndexError:
+                return events
 
-        if p_state.__name__ == 'listen' and self.react_event is not None:
-            debug_window.write(str(self.react_event))
+    def push_front(self, events):
+        """Put events taken out of the inbox back at its front, in order.
 
-        if n_state is not None:
-            debug_window.write('=> %s' % (n_state.__name__))
+        Arguments:
+            events: the Events, a list
+        """
+        if self.rules is not None:
+            self.taken -= len(events)
 
-        debug_window.write('')
+        self.events.extendleft(reversed(events))
 
+    def __iter__(self):
+        """Iterate over the live events, in order."""
+        if self.rules is None:
+            return iter(self.events)
 
-class Event:
-    """An event for interaction between state machines."""
+        return (event for n, event in enumerate(self.events, self.taken + 1)
+                if not self.is_dead(event, n))
 
-    def __init__(self, typ, emitter, value=None, destination=None, ack=False):
-        """Initialize the event.
+    def __len__(self):
+        return len(self.events)
 
-        Arguments:
-            typ: the event's type string
-            emitter: the StateMachine emitting the event
 
-        Keyword arguments:
-            value: value to transmit (default None)
-            destination: the StateMachine the event should end up with \
-                (default None)
-            ack: whether the receiving machine should emit an acknowledgement \
-                (default False)
-        """
-        self.typ = typ
-        self.value = value
-        self.emitter = emitter
-        self.destination = destination
-        self.ack = ack
+class BatchReaction:
+    """A reaction state that receives all queued events it matches at once.
 
-        self.state = None
+    Reaction maps hold these in place of the state itself, for reactions
+    added with `batch` set.
+    """
 
-        self.n = -1
+    def __init__(self, state):
+        """Initialize the reaction.
 
-    def __repr__(self):
-        return '<Ev(%d):typ=%s,emitter=%s,destination=%s,ack=%s>' % (
-            self.n, self.typ, self.emitter, self.destination, self.ack)
+        Arguments:
+            state: the state to transition to
+        """
+        self.state = state
+        self.__name__ = state.__name__
 
 
 class StateMachine:
@@ -436,9 +1757,14 @@ class StateMachine:
     However, referring to both states is no problem (and usually necessary).
 
     The current event can be referred to through `self.event`. Do not mutate
-    this variable.
+    this variable. A batched reaction gets all events it reacts to through
+    `self.events` instead, of which `self.event` is the first.
     """
 
+    events = ()
+    skipped = 0
+    var_cache = None
+
     def __init__(self, ctl, ctx):
         """Initialize the state machine.
 
@@ -451,9 +1777,12 @@ class StateMachine:
         """
         self.ctl = ctl
         self.ctx = ctx
+        self.handle = None
 
-        self.inbox = queue()
+        self.inbox = Inbox(ctl)
         self.event = None
+        self.in_flight = 0
+        self.acks = {}
 
         self.is_suspended = False
 
@@ -467,8 +1796,38 @@ class StateMachine:
         `self.info` should contain a list of tuples with a format string and
         the name of a variable. This method aggregates them into a
         comma-separated string containing these formatted values.
+
+        A variable is only formatted again if its value changed since the
+        last call. To detect this, a snapshot of each value is kept. This is
+        only done for immutable values, and for lists, dictionaries and sets of
+        such values. Any other value is formatted on every call.
         """
-        values = [inf[0] % (getattr(self, inf[1])) for inf in self.info]
+        cache = self.var_cache
+        if cache is None:
+            cache = self.var_cache = {}
+
+        values = []
+
+        for inf in self.info:
+            value = getattr(self, inf[1])
+
+            cached = cache.get(inf)
+            if cached is not None:
+                typ, snapshot, formatted = cached
+
+                if typ is type(value) and is_unchanged(snapshot, value):
+                    values.append(formatted)
+                    continue
+
+            formatted = inf[0] % (value)
+
+            if can_snapshot(value):
+                cache[inf] = (type(value), snapshot_value(value), formatted)
+            elif cached is not None:
+                del cache[inf]
+
+            values.append(formatted)
+
         return ', '.join(values)
 
     def cycle(self):
@@ -476,11 +1835,29 @@ class StateMachine:
 
         If no next state is obtained, the new state will be 'listen`.
         """
-        new_state = self.current_state()
+        self.transition(self.current_state())
+
+    def ends_turn(self):
+        """Return whether the machine is about to listen or halt.
+
+        Machine control does not run such a state in the same turn as the
+        states before it.
+        """
+        return self.current_state.__name__ in ('listen', 'halt')
+
+    def transition(self, new_state):
+        """Transition to the state returned by the current state.
+
+        A halted machine stays in its halt state. If no next state is given,
+        the new state will be `listen'.
 
+        Arguments:
+            new_state: the state returned by the current state, or None
+        """
         if self.current_state.__name__ == 'halt':
-            new_state = self.current_state
-        elif new_state is None:
+            return
+
+        if new_state is None:
             new_state = self.listen
 
         self.current_state = new_state
@@ -508,48 +1885,160 @@ class StateMachine:
             ack_state: a state for acknowledgement, a method
 
         If `ack_state` is given, the receiving machine will send an
-        acknowledgement event. When the emitting machine recieves this event,
-        it will transition to the given state.
+        acknowledgement event, of type `typ` + \`_ack'. When the emitting
+        machine recieves this event, it will transition to the given state.
+        This reaction only applies to the acknowledgement of this event. If the
+        receiving machine halts without acknowledging the event, the reaction
+        is removed.
         """
-        self.ctl.emit(Event(typ, self, value=value, destination=destination,
-                            ack=ack_state is not None))
+        event = Event(typ, self, value=value, destination=destination,
+                      ack=ack_state is not None)
+        self.ctl.emit(event)
 
         if ack_state is not None:
-            self.when_machine_emits(typ + '_ack', destination, ack_state)
+            self.acks[event.n] = (self.ctl.ack_type(typ), destination.handle,
+                                  ack_state)
+
+    def emit_to_many(self, destinations, typ, value=None, ack_state=None):
+        """Emit a single event to many machines.
+
+        Arguments:
+            destinations: the StateMachines to send the event to, or the name \
+                of a group
+            typ: the event's type string
+
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+            ack_state: a state for acknowledgement, a method
+
+        If `ack_state` is given, every receiving machine acknowledges the
+        event. Once all have, the emitting machine receives a single
+        acknowledgement event, of type `typ` + \`_ack', and transitions to the
+        given state. A machine that halts before acknowledging the event no
+        longer holds up this completion.
+        """
+        if isinstance(destinations, str):
+            destinations = self.ctl.group(destinations)
+        else:
+            destinations = tuple(destinations)
+
+        event = Event(typ, self, value=value, destination=destinations,
+                      ack=ack_state is not None)
+        self.ctl.emit(event)
+
+        if ack_state is not None:
+            self.acks[event.n] = (self.ctl.ack_type(typ), None, ack_state)
+
+    def join_group(self, name):
+        """Join a named group, to receive the events emitted to it.
+
+        A machine leaves all its groups when it halts.
+
+        Arguments:
+            name: the group's name string
+        """
+        self.ctl.join_group(name, self)
+
+    def leave_group(self, name):
+        """Leave a named group.
+
+        Arguments:
+            name: the group's name string
+        """
+        self.ctl.leave_group(name, self)
+
+    def start_timer(self, delay, typ, value=None):
+        """Start a timer and return it.
+
+        After the delay, the machine emits an event to itself. To react to it,
+        use `when_machine_emits` with the machine itself.
+
+        Arguments:
+            delay: the delay in seconds
+            typ: the timer event's type string
+
+        Keyword arguments:
+            value: value to transmit with the event (default None)
+        """
+        return self.ctl.add_timer(self, delay, typ, value=value)
+
+    def cancel_timer(self, timer):
+        """Cancel a timer that has not gone off yet.
+
+        Arguments:
+            timer: a timer, as returned by `start_timer`
+        """
+        self.ctl.cancel_timer(timer)
 
     def start_machine(self, machine_cls, *args, **kwargs):
         """Instantiate and start a machine.
 
+        The new machine is registered with MachineControl, which gives it a
+        handle.
+
         Arguments:
             machine_cls: a StateMachine subclass
             \*args/\*\*kwargs: any arguments the state machine takes
         """
         return self.ctl.start_machine(machine_cls, self, *args, **kwargs)
 
-    def when_machine_emits(self, typ, machine, state):
+    def start_machines(self, machine_cls, args_iterable, **kwargs):
+        """Instantiate and start many machines of a class, and return them.
+
+        Arguments:
+            machine_cls: a StateMachine subclass
+            args_iterable: a tuple of positional arguments for each machine
+            \*\*kwargs: any keyword arguments every machine takes
+        """
+        return self.ctl.start_machines(machine_cls, self, args_iterable,
+                                       **kwargs)
+
+    def when_machine_emits(self, typ, machine, state, batch=False):
         """Add a machine event reaction.
 
         Arguments:
             typ: the event's type string
             machine: the emitting StateMachine
             state: the state to transition to, a method
+
+        Keyword arguments:
+            batch: let the state react to all queued events with this \
+                reaction state at once, see `when` (default False)
         """
+        if batch:
+            state = BatchReaction(state)
+
         self.ctl.add_machine_reaction(typ, machine, self, state)
 
-    def when(self, typ, state):
+    def when(self, typ, state, batch=False):
         """Add an event reaction.
 
         Arguments:
             typ: the event's type string
             state: the state to transition to, a method
+
+        Keyword arguments:
+            batch: let the state react to all queued events with this \
+                reaction state at once (default False)
+
+        A batched reaction takes every event in the inbox whose reaction is
+        the same batched state, and passes them to the state as
+        `self.events`. They are received before any other queued events.
         """
+        if batch:
+            state = BatchReaction(state)
+
         self.ctl.add_event_reaction(typ, self, state)
 
     def ignore_when_machine_emits(self, typ, machine):
         """Remove a machine event reaction.
 
         Besides ignoring further such events, all events from the given machine
-        and of the given type in the machine's inbox are removed.
+        and of the given type in the machine's inbox are removed. Awaited
+        acknowledgements of this type from the machine are forgotten too.
+
+        The events are not removed right away, but marked as dead in the
+        inbox, and skipped when listening.
 
         Arguments:
             typ: the event's type string
@@ -557,40 +2046,29 @@ class StateMachine:
         """
         self.ctl.remove_machine_reaction(typ, machine, self)
 
-        inbox_prime = queue()
-        while True:
-            try:
-                event = self.inbox.popleft()
-            except IndexError:
-                break
+        if self.acks:
+            self.acks = {n: pending for n, pending in self.acks.items()
+                         if pending[0] != typ or pending[1] != machine.handle}
 
-            if event.typ != typ or event.emitter != machine:
-                inbox_prime.append(event)
-
-        self.inbox = inbox_prime
+        self.inbox.ignore(typ, machine.handle)
 
     def ignore_when(self, typ):
         """Remove an event reaction.
 
-        Besides ignoring further such events, all events from the given machine
-        and of the given type in the machine's inbox are removed.
+        Besides ignoring further such events, all events of the given type in
+        the machine's inbox are removed, as with `ignore_when_machine_emits`.
+        Awaited acknowledgements of this type are forgotten too.
 
         Arguments:
             type: the event's type string
         """
         self.ctl.remove_event_reaction(typ, self)
 
-        inbox_prime = queue()
-        while True:
-            try:
-                event = self.inbox.popleft()
-            except IndexError:
-                break
-
-            if event.typ != typ:
-                inbox_prime.append(event)
+        if self.acks:
+            self.acks = {n: pending for n, pending in self.acks.items()
+                         if pending[0] != typ}
 
-        self.inbox = inbox_prime
+        self.inbox.ignore(typ)
 
     def filter_event(self, event):
         """Return a state if a reaction to the event exists.
@@ -607,16 +2085,28 @@ class StateMachine:
 
         Checks the event inbox for any events and possible reactions. If an
         acknowledgement is required, this is sent.
+
+        If machine control skips ignored events, events without a reaction
+        are discarded until one with a reaction is found. The number of
+        events discarded this way, including the first, is added to
+        `self.skipped`.
         """
+        inbox = self.inbox
+
         try:
-            self.event = self.inbox.popleft()
+            self.event = inbox.popleft()
         except IndexError:
             self.ctl.react_event = None
-            self.is_suspended = True
+            self.ctl.suspend(self)
             return
 
         reaction = self.filter_event(self.event)
 
+        self.ctl.release(self.event)
+
+        if reaction is None and self.ctl.skip_ignored and inbox:
+            reaction = self.skip_ignored()
+
         if reaction is None:
             self.ctl.react_event = None
             return
@@ -624,8 +2114,79 @@ class StateMachine:
         self.ctl.react_event = self.event
 
         if self.event.ack:
-            self.emit_to(self.event.emitter, self.event.typ + '_ack',
-                         value=self.event.value)
+            self.ctl.acknowledge(self.event, self)
+
+        if reaction.__class__ is BatchReaction:
+            return self.take_batch(reaction)
+
+        return reaction
+
+    def take_batch(self, reaction):
+        """Take all queued events with the same batched reaction state.
+
+        They are removed from the inbox and put in `self.events`, after the
+        current event. Other events stay queued, in their order. Events that
+        complete an awaited acknowledgement are left alone, as they have a
+        reaction of their own.
+
+        Arguments:
+            reaction: the BatchReaction to the current event
+        """
+        state = reaction.state
+        events = [self.event]
+
+        # Acknowledgements to the machine itself arrive meanwhile.
+        queued = self.inbox.drain()
+        rest = []
+
+        for event in queued:
+            if event.acked is not None and event.acked in self.acks:
+                rest.append(event)
+                continue
+
+            other = self.filter_event(event)
+
+            if other.__class__ is BatchReaction and other.state == state:
+                events.append(event)
+                self.ctl.release(event)
+
+                if event.ack:
+                    self.ctl.acknowledge(event, self)
+            else:
+                rest.append(event)
+
+        self.inbox.push_front(rest)
+        self.events = events
+
+        return state
+
+    def skip_ignored(self):
+        """Discard events from the inbox until one has a reaction.
+
+        The reaction is returned, or None if the inbox ran out. The event is
+        left in `self.event`. The event `listen` took before, which had no
+        reaction, counts as skipped as well.
+        """
+        inbox = self.inbox
+        release = self.ctl.release
+        skipped = 1
+        reaction = None
+
+        while True:
+            try:
+                self.event = inbox.popleft()
+            except IndexError:
+                break
+
+            reaction = self.filter_event(self.event)
+            release(self.event)
+
+            if reaction is not None:
+                break
+
+            skipped += 1
+
+        self.skipped += skipped
 
         return reaction
 
@@ -639,3 +2200,173 @@ class StateMachine:
         """
         self.emit('halt')
         self.ctl.halt(self)
+
+
+LISTEN = 0
+HALT = 1
+
+
+class CompiledStates(type):
+    """Number the states of a state machine class when it is defined.
+
+    Every method of the class and its bases, except those of the simulator
+    itself, gets an integer ID. The \`listen' and \`halt' states always have
+    IDs 0 and 1. The class gets a dispatch table, `state_table`, with the
+    state functions by ID, and `state_ids`, mapping them back to their IDs.
+
+    States that are not methods of the class when it is defined, e.g. ones
+    added to an instance, are numbered when first used.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+
+        cls.state_table = [StateMachine.listen, StateMachine.halt]
+        cls.state_ids = {StateMachine.listen: LISTEN, StateMachine.halt: HALT}
+
+        for klass in reversed(cls.__mro__):
+            if klass.__module__ == __name__:
+                continue
+
+            for attr, value in vars(klass).items():
+                if (inspect.isfunction(value) and not attr.startswith('__')
+                        and value not in cls.state_ids):
+                    cls.add_state(value)
+
+    def add_state(cls, func):
+        """Number a state function and return its ID.
+
+        Arguments:
+            func: the state's function
+        """
+        state_id = len(cls.state_table)
+
+        cls.state_table.append(func)
+        cls.state_ids[func] = state_id
+
+        return state_id
+
+
+class CompiledStateMachine(StateMachine, metaclass=CompiledStates):
+    """Represent a state machine with precomputed state dispatch.
+
+    This is a drop-in replacement for StateMachine as a superclass. The
+    current state is kept as an integer ID, and states are run through the
+    class' dispatch table as plain functions. Reactions store these functions
+    instead of bound methods.
+
+    `current_state` is still available, as a bound method, and can be set to
+    a method of the machine. States must be methods of the machine itself.
+    """
+
+    def __init__(self, ctl, ctx):
+        """Initialize the state machine.
+
+        Arguments:
+            ctl: a MachineControl instance
+            ctx: the machine's context, a StateMachine
+        """
+        self.state_id = HALT
+
+        super().__init__(ctl, ctx)
+
+    @property
+    def current_state(self):
+        """The current state, a bound method."""
+        return self.state_table[self.state_id].__get__(self)
+
+    @current_state.setter
+    def current_state(self, state):
+        self.state_id = self.state_index(state)
+
+    def state_index(self, state):
+        """Return the ID of a state, numbering it if it is new.
+
+        Arguments:
+            state: a method of the machine, or its function
+        """
+        func = getattr(state, '__func__', state)
+
+        try:
+            return self.state_ids[func]
+        except KeyError:
+            return type(self).add_state(func)
+
+    def cycle(self):
+        """Run the current state and determine the next.
+
+        If no next state is obtained, the new state will be \`listen'.
+        """
+        state_id = self.state_id
+        new_state = self.state_table[state_id](self)
+
+        if state_id == HALT:
+            return
+
+        if new_state is None:
+            self.state_id = LISTEN
+        elif new_state.__class__ is MethodType:
+            try:
+                self.state_id = self.state_ids[new_state.__func__]
+            except KeyError:
+                self.state_id = self.state_index(new_state)
+        else:
+            try:
+                self.state_id = self.state_ids[new_state]
+            except KeyError:
+                self.state_id = self.state_index(new_state)
+
+    def ends_turn(self):
+        """Return whether the machine is about to listen or halt."""
+        return self.state_id <= HALT
+
+    def transition(self, new_state):
+        """Transition to the state returned by the current state.
+
+        Arguments:
+            new_state: the state returned by the current state, or None
+        """
+        if self.state_id == HALT:
+            return
+
+        if new_state is None:
+            self.state_id = LISTEN
+        else:
+            self.state_id = self.state_index(new_state)
+
+    def when_machine_emits(self, typ, machine, state, batch=False):
+        """Add a machine event reaction.
+
+        Arguments:
+            typ: the event's type string
+            machine: the emitting StateMachine
+            state: the state to transition to, a method
+
+        Keyword arguments:
+            batch: let the state react to all queued events with this \
+                reaction state at once (default False)
+        """
+        func = self.state_table[self.state_index(state)]
+
+        if batch:
+            func = BatchReaction(func)
+
+        self.ctl.add_machine_reaction(typ, machine, self, func)
+
+    def when(self, typ, state, batch=False):
+        """Add an event reaction.
+
+        Arguments:
+            typ: the event's type string
+            state: the state to transition to, a method
+
+        Keyword arguments:
+            batch: let the state react to all queued events with this \
+                reaction state at once (default False)
+        """
+        func = self.state_table[self.state_index(state)]
+
+        if batch:
+            func = BatchReaction(func)
+
+        self.ctl.add_event_reaction(typ, self, func)
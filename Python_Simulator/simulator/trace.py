@@ -0,0 +1,137 @@
+"""Record runs to a compact binary trace, and render such traces.
+
+Tracing is turned on through MachineControl's `trace` argument, which names
+the file to write to. Unlike debug windows, tracing needs no process per
+machine and formats nothing while the program runs.
+
+Traces are read and rendered by the `trace_reader` module.
+
+The file starts with a magic string, followed by records. Each record starts
+with a single byte for its kind. Strings, i.e. class names, state names and
+event types, are written once as a name record and then referred to by ID.
+All other records have a fixed width.
+
+* N: a name; its ID, length and UTF-8 bytes
+* M: a started machine; its handle, its context's handle and its class name
+* B: the beginning of a cycle; the cycle number, machine handle and state
+* C: the end of a cycle; the new state and the number of the event the
+  machine reacted to, or 0
+* E: an emitted event; its number, type, emitter handle, destination handle,
+  -1 for a broadcast or -2 for many destinations, and whether it requires an
+  acknowledgement
+
+Classes:
+
+* TraceWriter: writes trace records during a run
+"""
+import struct
+
+
+MAGIC = b'PEPTRACE\x01'
+
+NAME = struct.Struct('<cIH')
+MACHINE = struct.Struct('<cqqI')
+BEGIN = struct.Struct('<cQqI')
+END = struct.Struct('<cIQ')
+EMIT = struct.Struct('<cQIqq?')
+
+RECORDS = {
+    b'N': NAME,
+    b'M': MACHINE,
+    b'B': BEGIN,
+    b'C': END,
+    b'E': EMIT,
+}
+
+
+class TraceWriter:
+    """Write trace records of a run to a file.
+
+    Machines are traced by replacing their `cycle` method with one that
+    writes a record before and after it.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        """Open a trace file for writing.
+
+        Arguments:
+            path: the trace file's path
+
+        Keyword arguments:
+            buffer_size: the file's buffer size in bytes (default 1 MiB)
+        """
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(MAGIC)
+
+        self.names = {}
+        self.cycle_n = 0
+
+    def name_id(self, name):
+        """Return the ID of a string, writing a name record if it is new.
+
+        Arguments:
+            name: the string
+        """
+        try:
+            return self.names[name]
+        except KeyError:
+            name_id = self.names[name] = len(self.names)
+
+            data = name.encode()
+            self.file.write(NAME.pack(b'N', name_id, len(data)) + data)
+
+            return name_id
+
+    def machine(self, machine):
+        """Record a started machine, and trace its cycles.
+
+        Arguments:
+            machine: the new StateMachine
+        """
+        self.file.write(MACHINE.pack(b'M', machine.handle, machine.ctx.handle,
+                                     self.name_id(type(machine).__name__)))
+
+        cycle = machine.cycle
+        ctl = machine.ctl
+        write = self.file.write
+        name_id = self.name_id
+
+        def traced_cycle():
+            self.cycle_n += 1
+
+            state = machine.current_state.__name__
+            write(BEGIN.pack(b'B', self.cycle_n, machine.handle,
+                             name_id(state)))
+
+            cycle()
+
+            react_n = 0
+            if state == 'listen' and ctl.react_event is not None:
+                react_n = ctl.react_event.n
+
+            write(END.pack(b'C', name_id(machine.current_state.__name__),
+                           react_n))
+
+        machine.cycle = traced_cycle
+
+    def emit(self, event):
+        """Record an emitted event.
+
+        Arguments:
+            event: the Event, after it got its number
+        """
+        destination = event.destination
+        if destination is None:
+            destination = -1
+        elif destination.__class__ is tuple:
+            destination = -2
+        else:
+            destination = destination.handle
+
+        self.file.write(EMIT.pack(b'E', event.n, self.name_id(event.typ),
+                                  event.emitter.handle, destination,
+                                  event.ack))
+
+    def close(self):
+        """Flush and close the trace file."""
+        self.file.close()
@@ -0,0 +1,166 @@
+"""Render traces recorded by MachineControl.
+
+A trace is rendered with the same information the debug windows show,
+optionally filtered by machine handle or event type:
+
+    python -m simulator.trace_reader run.trace --machine 3 --type pass
+
+See the `trace` module for the file format.
+"""
+import argparse
+import sys
+
+from .trace import MAGIC, RECORDS
+
+
+def read_trace(path):
+    """Generate the records of a trace file as tuples.
+
+    Each tuple starts with the record's kind, as a string, followed by its
+    fields. Name records are resolved, so names are given as strings.
+
+    Arguments:
+        path: the trace file's path
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a trace file' % (path))
+
+        data = f.read()
+
+    names = {}
+    offset = 0
+
+    while offset < len(data):
+        kind = data[offset:offset + 1]
+        record = RECORDS[kind]
+
+        # A run that crashed may leave a partial record behind.
+        if offset + record.size > len(data):
+            break
+
+        fields = record.unpack_from(data, offset)
+        offset += record.size
+
+        if kind == b'N':
+            _, name_id, length = fields
+            names[name_id] = data[offset:offset + length].decode()
+            offset += length
+        elif kind == b'M':
+            yield ('M', fields[1], fields[2], names[fields[3]])
+        elif kind == b'B':
+            yield ('B', fields[1], fields[2], names[fields[3]])
+        elif kind == b'C':
+            yield ('C', names[fields[1]], fields[2])
+        else:
+            yield ('E', fields[1], names[fields[2]], fields[3], fields[4],
+                   fields[5])
+
+
+def render(path, out, machines=None, types=None):
+    """Write a trace in the form the debug windows show it.
+
+    Every line is prefixed with the cycle number and the machine. If machines
+    or types are given, only cycles of those machines, and only events of
+    those types, are shown. A cycle is shown if its machine reacted to an
+    event of a shown type, or emitted one.
+
+    Arguments:
+        path: the trace file's path
+        out: a writable text file
+
+    Keyword arguments:
+        machines: a set of machine handles to show (default all)
+        types: a set of event types to show (default all)
+    """
+    described = {}
+    events = {}
+
+    def describe(handle):
+        if handle == -1:
+            return 'None'
+        if handle == -2:
+            return 'many'
+
+        return described.get(handle, 'context')
+
+    def show_event(n):
+        typ, emitter, destination, ack = events[n]
+        return '<Ev(%d):typ=%s,emitter=%s,destination=%s,ack=%s>' % (
+            n, typ, describe(emitter), describe(destination), ack)
+
+    cycle = None
+    lines = []
+
+    for record in read_trace(path):
+        kind = record[0]
+
+        if kind == 'M':
+            _, handle, ctx, cls_name = record
+            described[handle] = '%s(%d)' % (cls_name, handle)
+
+        elif kind == 'E':
+            _, n, typ, emitter, destination, ack = record
+            events[n] = (typ, emitter, destination, ack)
+
+            if types is not None and typ not in types:
+                continue
+
+            if cycle is None:
+                if machines is None or emitter in machines:
+                    out.write('- %s Emitting %s\n' % (describe(emitter),
+                                                      show_event(n)))
+            else:
+                cycle[2] = True
+                lines.append('Emitting %s' % (show_event(n)))
+
+        elif kind == 'B':
+            _, cycle_n, handle, state = record
+
+            cycle = [cycle_n, handle, types is None]
+            lines = ['State: %s' % (state)]
+
+            if state == 'halt':
+                lines.append('HALTED')
+
+        elif kind == 'C':
+            _, state, react_n = record
+            cycle_n, handle, shown = cycle
+
+            if lines[0] != 'State: halt':
+                if react_n:
+                    shown = shown or events[react_n][0] in types
+                    lines.append(show_event(react_n))
+
+                lines.append('=> %s' % (state))
+
+            if shown and (machines is None or handle in machines):
+                prefix = '%d %s ' % (cycle_n, describe(handle))
+                for line in lines:
+                    out.write(prefix + line + '\n')
+
+            cycle = None
+            lines = []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render a trace recorded by MachineControl.')
+    parser.add_argument('path')
+    parser.add_argument('--machine', type=int, action='append',
+                        help='only show this machine handle (repeatable)')
+    parser.add_argument('--type', action='append',
+                        help='only show this event type (repeatable)')
+    args = parser.parse_args()
+
+    machines = set(args.machine) if args.machine else None
+    types = set(args.type) if args.type else None
+
+    try:
+        render(args.path, sys.stdout, machines=machines, types=types)
+    except BrokenPipeError:
+        ...
+
+
+if __name__ == '__main__':
+    main()
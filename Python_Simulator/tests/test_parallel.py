@@ -0,0 +1,36 @@
+"""Tests of running programs on multiple worker processes."""
+import time
+
+from simulator import StateMachine
+from simulator.parallel import ParallelMachineControl
+
+
+class Sleeper(StateMachine):
+    def __init__(self, ctl, ctx, path, delay):
+        super().__init__(ctl, ctx)
+
+        self.path = path
+        self.delay = delay
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when_machine_emits('wake', self, self.wake)
+        self.start_timer(self.delay, 'wake')
+
+    def wake(self):
+        with open(self.path, 'w') as f:
+            f.write('woke')
+
+        return self.halt
+
+
+def test_pending_timer_keeps_partition_busy(tmp_path, capfd):
+    path = tmp_path / 'woke'
+
+    started = time.monotonic()
+    ParallelMachineControl(workers=2).run(Sleeper, str(path), 0.5)
+
+    assert time.monotonic() - started >= 0.5
+    assert path.read_text() == 'woke'
+    assert 'Deadlock' not in capfd.readouterr().err
@@ -0,0 +1,31 @@
+"""Tests of the statistics collected by the profiler."""
+import pytest
+
+from simulator import MachineControl, StateMachine
+
+
+class Picky(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when_machine_emits('want', self, self.got)
+
+        for typ in ('x', 'x', 'x', 'want'):
+            self.emit_to(self, typ)
+
+    def got(self):
+        return self.halt
+
+
+@pytest.mark.parametrize('skip_ignored, received', [(False, 4), (True, 1)])
+def test_discarded_events_are_counted_once(skip_ignored, received):
+    ctl = MachineControl(profile=True, skip_ignored=skip_ignored)
+    ctl.run(Picky)
+
+    stats = ctl.stats()['Picky']
+
+    assert stats['received'] == received
+    assert stats['ignored'] + stats['skipped'] == 3
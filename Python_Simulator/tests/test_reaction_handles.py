@@ -0,0 +1,59 @@
+"""Tests of adding reactions before and after a machine is registered."""
+import pytest
+
+from simulator import MachineControl, StateMachine
+
+
+class Eager(StateMachine):
+    def __init__(self, ctl, ctx):
+        super().__init__(ctl, ctx)
+
+        self.when('go', self.go)
+
+    def go(self):
+        return self.halt
+
+
+class Patient(StateMachine):
+    def __init__(self, ctl, ctx, log):
+        super().__init__(ctl, ctx)
+
+        self.log = log
+        self.init_state = self.setup
+
+    def setup(self):
+        self.when('go', self.go)
+        self.emit('go')
+
+    def go(self):
+        self.log.append(self.handle)
+        self.emit_to(self.ctx, 'done')
+
+
+class Parent(StateMachine):
+    def __init__(self, ctl, ctx, log):
+        super().__init__(ctl, ctx)
+
+        self.log = log
+        self.init_state = self.setup
+
+    def setup(self):
+        self.children = self.start_machines(Patient,
+                                            [(self.log,), (self.log,)])
+        self.when('done', self.done)
+
+    def done(self):
+        if len(self.log) == len(self.children):
+            return self.halt
+
+
+def test_reaction_in_init_is_rejected():
+    with pytest.raises(RuntimeError, match='Eager is not registered yet'):
+        MachineControl(debug=False).run(Eager)
+
+
+def test_reactions_in_initial_state_are_kept_apart():
+    log = []
+    MachineControl(debug=False).run(Parent, log)
+
+    assert len(log) == 2 and len(set(log)) == 2
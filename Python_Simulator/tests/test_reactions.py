@@ -0,0 +1,12 @@
+"""Tests that long runs do not leak reactions or memory."""
+import pytest
+
+from benchmarks import reactions
+
+
+@pytest.mark.parametrize('ready_queue', [False, True])
+def test_spawned_workers_leave_nothing_behind(ready_queue):
+    samples = reactions.run(4000, 4, ready_queue=ready_queue)
+
+    assert len(samples) == 5
+    assert reactions.check(samples, 4096) == []
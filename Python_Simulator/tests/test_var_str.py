@@ -0,0 +1,71 @@
+"""Tests of formatting machine variables for debug windows."""
+import pytest
+
+from simulator import MachineControl, StateMachine
+
+
+class Box:
+    def __init__(self, v):
+        self.v = v
+
+    def __repr__(self):
+        return 'Box(%d)' % (self.v)
+
+
+def machine(value):
+    m = StateMachine(MachineControl(), None)
+    m.value = value
+    m.info = [('value=%r', 'value')]
+
+    return m
+
+
+def test_mutated_object_is_formatted_again():
+    m = machine(Box(0))
+    assert m.var_str() == 'value=Box(0)'
+
+    m.value.v = 5
+    assert m.var_str() == 'value=Box(5)'
+
+
+def test_mutated_nested_list_is_formatted_again():
+    m = machine([[0]])
+    assert m.var_str() == 'value=[[0]]'
+
+    m.value[0][0] = 9
+    assert m.var_str() == 'value=[[9]]'
+
+
+@pytest.mark.parametrize('before, after', [
+    ([1], [1.0]),
+    ([1, 2], [1, 2, 3]),
+    ({1: 1}, {1: True}),
+    ({'a'}, {'b'}),
+    (0.0, -0.0),
+])
+def test_equal_values_of_other_types_are_formatted_again(before, after):
+    m = machine(before)
+    assert m.var_str() == 'value=%r' % (before,)
+
+    m.value = after
+    assert m.var_str() == 'value=%r' % (after,)
+
+
+def test_equal_tuple_of_other_types_is_formatted_again():
+    m = StateMachine(MachineControl(), None)
+    m.value = (1,)
+    m.info = [('value=%s', 'value')]
+
+    assert m.var_str() == 'value=1'
+
+    m.value = (True,)
+    assert m.var_str() == 'value=True'
+
+
+def test_mutated_list_is_formatted_again():
+    m = machine([3, 1, 2])
+    assert m.var_str() == 'value=[3, 1, 2]'
+
+    m.value.sort()
+    assert m.var_str() == 'value=[1, 2, 3]'
+    assert m.var_str() == 'value=[1, 2, 3]'